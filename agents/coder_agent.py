@@ -4,21 +4,375 @@ Third agent in the multi-agent pipeline for 3D asset generation
 """
 
 import asyncio
+import io
+import sys
 import time
 import logging
+from collections import OrderedDict
 from datetime import datetime
-from typing import Dict, List, Optional, Any, Tuple
+from itertools import chain
+from functools import cached_property
+from typing import Dict, List, Any, Tuple
 from concurrent.futures import ThreadPoolExecutor
-from pathlib import Path
+from string import Formatter
+from types import MappingProxyType
 
 from .base_agent import BaseAgent
 from .simple_validator import SimpleAPIValidator
 from .models import (
-    AgentType, AgentStatus, AgentResponse,
+    AgentType, AgentStatus,
     CoderInput, CoderOutput, GeneratedScript,
     APIMapping, TaskPlan, SubTask, TaskType
 )
 
+# Interned API category keys - looked up once per API call during generation
+_CAT_MESH = sys.intern("mesh_operators")
+_CAT_OBJECT = sys.intern("object_operators")
+_CAT_GEOMETRY = sys.intern("geometry_nodes")
+_CAT_SHADER = sys.intern("shader_nodes")
+_CAT_MATERIAL = sys.intern("material_operators")
+_CAT_ANIMATION = sys.intern("animation_operators")
+_CAT_SCENE = sys.intern("scene_operators")
+
+# API category to import mapping (shared, read-only)
+# Note: bpy.ops.* are not importable modules, they are accessed via bpy.ops
+# Only import the base modules that are actually importable
+_CATEGORY_IMPORTS = MappingProxyType({
+    _CAT_MESH: (),  # bpy.ops.mesh is accessed via bpy (already imported)
+    _CAT_OBJECT: (),  # bpy.ops.object is accessed via bpy (already imported)
+    _CAT_GEOMETRY: (),  # bpy.ops.geometry is accessed via bpy (already imported)
+    _CAT_SHADER: (),  # bpy.ops.shader is accessed via bpy (already imported)
+    _CAT_MATERIAL: (),  # bpy.ops.material is accessed via bpy (already imported)
+    _CAT_ANIMATION: (),  # bpy.ops.anim is accessed via bpy (already imported)
+    _CAT_SCENE: ()  # bpy.ops.scene is accessed via bpy (already imported)
+})
+_category_imports_get = _CATEGORY_IMPORTS.get  # bound lookup for the hot loops
+
+# Common color mappings to RGBA values
+_COLOR_RGBA = {
+    'red': (1.0, 0.0, 0.0, 1.0),
+    'green': (0.0, 1.0, 0.0, 1.0),
+    'blue': (0.0, 0.0, 1.0, 1.0),
+    'yellow': (1.0, 1.0, 0.0, 1.0),
+    'orange': (1.0, 0.5, 0.0, 1.0),
+    'purple': (0.5, 0.0, 1.0, 1.0),
+    'pink': (1.0, 0.0, 0.5, 1.0),
+    'brown': (0.6, 0.3, 0.1, 1.0),
+    'black': (0.0, 0.0, 0.0, 1.0),
+    'white': (1.0, 1.0, 1.0, 1.0),
+    'gray': (0.5, 0.5, 0.5, 1.0),
+    'grey': (0.5, 0.5, 0.5, 1.0)
+}
+
+# Object type mappings to Blender mesh primitives
+_OBJECT_PRIMITIVES = {
+    'ball': 'primitive_uv_sphere_add',
+    'sphere': 'primitive_uv_sphere_add',
+    'cube': 'primitive_cube_add',
+    'box': 'primitive_cube_add',
+    'cylinder': 'primitive_cylinder_add',
+    'cone': 'primitive_cone_add',
+    'mug': 'primitive_cylinder_add',
+    'cup': 'primitive_cylinder_add',
+    'chair': 'primitive_cube_add',
+    'table': 'primitive_cube_add'
+}
+
+# SAFETY CHECK patterns: dangerous Blender operations that can cause crashes
+# These patterns are VERY SPECIFIC to avoid blocking legitimate asset creation operations
+_DANGEROUS_PATTERNS = (
+    # UI/Viewport manipulation (CRITICAL - causes crashes)
+    "bpy.ops.view3d.view_selected",  # Viewport navigation - CRASHES BLENDER
+    "bpy.ops.view3d.view_all",       # Viewport navigation - CRASHES BLENDER
+    "bpy.ops.view3d.view_center_cursor", # Viewport navigation - CRASHES BLENDER
+    "bpy.ops.view3d.view_camera",    # Viewport navigation - CRASHES BLENDER
+    "bpy.context.screen.areas",      # UI screen area access
+    "space.shading.type =",          # Viewport shading assignment
+    "area.type == 'VIEW_3D'",        # UI area detection
+    "space.type == 'VIEW_3D'",       # UI space detection  
+    "bpy.context.window",            # Window management
+    "bpy.context.area.spaces",       # UI area space access
+    ".shading.type = 'MATERIAL_PREVIEW'",  # Specific viewport shading change
+    ".shading.type = 'RENDERED'",    # Specific viewport shading change
+    "for area in bpy.context.screen", # Screen area iteration
+    # Additional dangerous viewport operations
+    "bpy.ops.screen.",               # Screen operations
+    "bpy.ops.wm.window",             # Window manager operations
+    "bpy.context.area.type",         # Area type manipulation
+    "bpy.context.space_data"         # Space data manipulation
+)
+
+# Scans run over the UTF-8 encoded script: 1 byte per ASCII char instead of up to 4
+# for str, and UTF-8 multi-byte sequences can never match an ASCII pattern
+_DANGEROUS_PATTERNS_BYTES = tuple(pattern.encode() for pattern in _DANGEROUS_PATTERNS)
+
+# Components every generated script must contain
+_REQUIRED_COMPONENTS = (
+    "import bpy",
+    "class BlenderScriptExecutor",
+    "def execute_plan",
+    "if __name__ == \"__main__\""
+)
+_REQUIRED_COMPONENTS_BYTES = tuple(component.encode() for component in _REQUIRED_COMPONENTS)
+
+# Modules every generated script depends on
+_BASE_DEPENDENCIES = frozenset(("bpy", "bmesh", "mathutils"))
+
+# Translation table turning subtask ids into valid method-name suffixes
+_SUBTASK_ID_TRANS = str.maketrans('-', '_')
+
+# Subtask types that create a trackable object
+_OBJECT_CREATION_TYPES = frozenset({
+    TaskType.CREATE_CHARACTER,
+    TaskType.CREATE_OBJECT,
+    TaskType.CREATE_FURNITURE
+})
+
+# Pre-parsed code templates for the execute_plan method
+_EXEC_PLAN_HEADER = '''
+    def execute_plan(self, export_path: str = None):
+        """Execute the complete plan"""
+        self.log_info("Starting plan execution...")
+        
+        # Setup scene
+        self.setup_scene()
+        
+        # Execute subtasks in dependency order'''
+
+_EXEC_SUBTASK_TPL = '''
+        
+        # Execute: {subtask_id}
+        if not self.execute_{task_id_us}():
+            self.log_error("Failed to execute {subtask_id}")
+            return False'''
+
+_EXEC_PLAN_NO_MAPPINGS = '''
+        
+        # No API mappings available - this should not happen with proper fallback
+        self.log_error("No API mappings found. Coordinator Agent fallback mechanism failed.")
+        self.log_error("This indicates a critical issue with the API search fallback.")
+        return False'''
+
+_EXEC_PLAN_FOOTER = '''
+        
+        # Cleanup and export
+        self.cleanup_and_export(export_path)
+        
+        self.log_info("Plan execution completed successfully!")
+        return True
+
+'''
+
+# Script-level entry point, written after the imports
+_MAIN_FOOTER = '''# Main execution
+if __name__ == "__main__":
+    executor = BlenderScriptExecutor()
+    
+    # Get export path from command line arguments or use default
+    export_path = sys.argv[-1] if len(sys.argv) > 1 and sys.argv[-1].endswith('.gltf') else None
+    
+    # Execute the plan
+    success = executor.execute_plan(export_path)
+    
+    if success:
+        print("✅ Script execution completed successfully!")
+    else:
+        print("❌ Script execution failed!")
+        sys.exit(1)
+'''
+
+# Pre-parsed code templates for the per-subtask execution methods
+# The whole method is formatted once per subtask; {body} and {tracking} are
+# pre-built fragments inserted verbatim
+_METHOD_TPL = '''
+    def execute_{task_id_us}(self):
+        """Execute subtask: {title}"""
+        self.log_info("Starting subtask: {title}")
+        
+        try:{body}{tracking}
+            
+            self.log_info("Completed subtask: {title}")
+            return True
+            
+        except Exception as e:
+            self.log_error(f"Subtask {title} failed: {{str(e)}}")
+            return False
+'''
+
+_DEFAULT_OBJECT_TPL = '''
+            
+            # Create visible object for {title}
+            success = self.safe_execute_api(
+                "bpy.ops.mesh.{object_type}",
+                {{"radius": 2.0, "location": [0, 0, 0]}}
+            )
+            
+            if not success:
+                self.log_error(f"Failed to create object")
+                return False
+            
+            # Track the created object
+            if bpy.context.active_object:
+                self.add_created_object(bpy.context.active_object.name, "generated_object")'''
+
+_OBJECT_TRACKING_TPL = '''
+            
+            # Track created object
+            if bpy.context.active_object:
+                self.add_created_object(
+                    bpy.context.active_object.name,
+                    "{subtask_type}"
+                )'''
+
+# Tracking fragments depend only on the subtask type, so format them once
+_OBJECT_TRACKING_CODE = {
+    task_type: _OBJECT_TRACKING_TPL.format(subtask_type=task_type.value)
+    for task_type in _OBJECT_CREATION_TYPES
+}
+
+_MATERIAL_METHOD_TPL = """
+            
+            # Create object and apply material with color for {title}
+            # First ensure we have an object to apply material to
+            if not bpy.context.active_object:
+                # Create a basic object if none exists
+                bpy.ops.mesh.{object_type}()
+                self.log_info(f"Created {{'{object_type}'}} object for material application")
+            
+            if bpy.context.active_object:
+                material_name = "Material_{task_id_us}"
+                material = self.create_material_safely(material_name, {color_info})
+                if material:
+                    success = self.apply_material_safely(bpy.context.active_object.name, material)
+                    if success:
+                        self.log_info(f"Applied {{material_name}} with color {color_info} to {{bpy.context.active_object.name}}")
+                        # Track the created object
+                        self.add_created_object(bpy.context.active_object.name, "material_object")
+                    else:
+                        self.log_error(f"Failed to apply material {{material_name}}")
+                        return False
+                else:
+                    self.log_error(f"Failed to create material {{material_name}}")
+                    return False
+            else:
+                self.log_error("No active object available for material application")
+                return False"""
+
+# Split at the call index so everything after it can be cached per distinct
+# (api_name, description, parameters)
+_APICALL_FRAG_HEAD = """
+            
+            # API Call """
+
+_APICALL_FRAG_TPL = """: {api_name}
+            # Description: {description}
+            success = self.safe_execute_api(
+                "{api_name}",
+                {clean_params}
+            )
+            
+            if not success:
+                self.log_error(f"Failed to execute {api_name}")
+                return False"""
+
+
+def _split_format_template(template: str, fields: Tuple[str, ...]) -> Tuple[str, ...]:
+    """
+    Split a str.format template into the literal chunks around its fields
+    
+    The chunks come back with escaped braces already collapsed, so the template
+    can be filled with a plain "".join instead of re-parsing it through
+    str.format on every call. fields must list the template's fields in order.
+    """
+    chunks = []
+    pending = []
+    found = []
+    for literal, field_name, format_spec, conversion in Formatter().parse(template):
+        pending.append(literal)
+        if field_name is None:
+            continue
+        if format_spec or conversion:
+            raise ValueError(f"Unsupported format spec on template field '{field_name}'")
+        found.append(field_name)
+        chunks.append("".join(pending))
+        pending = []
+    chunks.append("".join(pending))
+    
+    if tuple(found) != fields:
+        raise ValueError(f"Template fields {found} do not match expected {list(fields)}")
+    return tuple(chunks)
+
+
+def _scan_script_patterns(script_bytes: bytes) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+    """
+    Scan a UTF-8 encoded script for dangerous operations and missing required components
+    
+    Returns (errors, warnings).
+    """
+    # Plain substring checks: bytes.__contains__ uses CPython's fastsearch, which
+    # beats a single re alternation here since sre tries every alternative per position
+    errors = tuple(
+        f"FORBIDDEN OPERATION: Script contains dangerous Blender UI manipulation: '{pattern}'. Scripts must ONLY create 3D assets, not manipulate viewport/UI settings."
+        for pattern, pattern_bytes in zip(_DANGEROUS_PATTERNS, _DANGEROUS_PATTERNS_BYTES)
+        if pattern_bytes in script_bytes
+    )
+    
+    # Check for required components
+    warnings = tuple(
+        f"Missing component: {component}"
+        for component, component_bytes in zip(_REQUIRED_COMPONENTS, _REQUIRED_COMPONENTS_BYTES)
+        if component_bytes not in script_bytes
+    )
+    
+    return errors, warnings
+
+
+def _format_parameter_value(value: Any) -> Any:
+    """Format a parameter value for code generation (general isinstance path)"""
+    if isinstance(value, str):
+        return f'"{value}"'
+    elif isinstance(value, (list, tuple)):
+        return str(tuple(value))
+    elif isinstance(value, dict):
+        return str(value)
+    return value
+
+
+def _identity(value: Any) -> Any:
+    return value
+
+
+# Exact-type fast path for _format_parameter_value; subclasses fall back to it
+_PARAM_VALUE_FORMATTERS = {
+    str: lambda value: f'"{value}"',
+    list: lambda value: str(tuple(value)),
+    tuple: str,
+    dict: str,
+    int: _identity,
+    float: _identity,
+    bool: _identity,
+    type(None): _identity
+}
+
+
+def _index_subtasks(plan: TaskPlan) -> Dict[str, SubTask]:
+    """Map task_id to subtask; the first subtask wins on duplicate ids, like a linear search"""
+    return {subtask.task_id: subtask for subtask in reversed(plan.subtasks)}
+
+
+def _sanitize_params(parameters: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Bump tiny radius values so generated objects are visible
+    
+    Returns a new dict only when a change is needed; the caller's
+    parameters are never mutated.
+    """
+    radius = parameters.get("radius")
+    if radius is not None and type(radius) in (int, float) and radius < 1.0:
+        return {**parameters, "radius": 2.0}  # Make objects visible
+    return parameters
+
+
 class CoderAgent(BaseAgent):
     """
     Coder Agent that generates executable Python scripts from API mappings
@@ -32,6 +386,9 @@ class CoderAgent(BaseAgent):
     6. Add logging and debugging support
     """
     
+    # API category to import mapping, shared by all instances
+    category_imports = _CATEGORY_IMPORTS
+    
     def __init__(self):
         super().__init__(
             agent_type=AgentType.CODER,
@@ -41,31 +398,38 @@ class CoderAgent(BaseAgent):
         # Initialize API validator for crash prevention
         self.api_validator = SimpleAPIValidator()
         
-        # Code generation templates
-        self.script_templates = {
+        # Generated API call fragments keyed by (api_name, description, parameters repr) (LRU)
+        self._fragment_cache: "OrderedDict[Tuple[str, str, str], str]" = OrderedDict()
+        self._fragment_cache_maxsize = 4096
+        
+        # Code generation metrics
+        self.generation_metrics = []
+        self._initialized = True
+    
+    @cached_property
+    def script_templates(self) -> MappingProxyType:
+        """Code generation templates, built on first use (read-only, safe to share with worker threads)"""
+        return MappingProxyType({
             "header": self._get_script_header_template(),
             "imports": self._get_imports_template(),
             "setup": self._get_setup_template(),
             "cleanup": self._get_cleanup_template(),
             "error_handling": self._get_error_handling_template()
-        }
-        
-        # API category to import mapping
-        # Note: bpy.ops.* are not importable modules, they are accessed via bpy.ops
-        # Only import the base modules that are actually importable
-        self.category_imports = {
-            "mesh_operators": [],  # bpy.ops.mesh is accessed via bpy (already imported)
-            "object_operators": [],  # bpy.ops.object is accessed via bpy (already imported)
-            "geometry_nodes": [],  # bpy.ops.geometry is accessed via bpy (already imported)
-            "shader_nodes": [],  # bpy.ops.shader is accessed via bpy (already imported)
-            "material_operators": [],  # bpy.ops.material is accessed via bpy (already imported)
-            "animation_operators": [],  # bpy.ops.anim is accessed via bpy (already imported)
-            "scene_operators": []  # bpy.ops.scene is accessed via bpy (already imported)
-        }
-        
-        # Code generation metrics
-        self.generation_metrics = []
-        self._initialized = True
+        })
+    
+    @cached_property
+    def _header_chunks(self) -> Tuple[str, ...]:
+        """Static chunks of the header template, filled by joining (no str.format)"""
+        return _split_format_template(
+            self.script_templates["header"], ("timestamp", "original_prompt", "plan_id")
+        )
+    
+    @cached_property
+    def _imports_chunks(self) -> Tuple[str, ...]:
+        """Static chunks of the imports template, filled by joining (no str.format)"""
+        return _split_format_template(
+            self.script_templates["imports"], ("additional_imports",)
+        )
     
     def _get_script_header_template(self) -> str:
         """Get the script header template"""
@@ -92,6 +456,7 @@ class BlenderScriptExecutor:
         self.created_objects = []
         self.execution_context = {{}}
         self.errors = []
+        self.api_functions = {{}}  # API name -> resolved bpy callable
         
     def log_info(self, message: str):
         """Log information message"""
@@ -248,11 +613,14 @@ if bpy.context.mode != 'OBJECT':
         try:
             self.log_info(f"Executing: {{api_name}} with params: {{parameters}}")
             
-            # Get the API function
-            api_parts = api_name.split('.')
-            api_func = bpy
-            for part in api_parts[1:]:  # Skip 'bpy'
-                api_func = getattr(api_func, part)
+            # Get the API function (resolved once per API name)
+            api_func = self.api_functions.get(api_name)
+            if api_func is None:
+                api_parts = api_name.split('.')
+                api_func = bpy
+                for part in api_parts[1:]:  # Skip 'bpy'
+                    api_func = getattr(api_func, part)
+                self.api_functions[api_name] = api_func
             
             # Execute with parameters
             result = api_func(**parameters)
@@ -278,26 +646,33 @@ if bpy.context.mode != 'OBJECT':
         try:
             self.logger.info(f"Generating script for {len(input_data.api_mappings)} API mappings")
             
-            start_time = time.time()
+            start_time = time.perf_counter_ns()
+            
+            # O(1) subtask lookups for every mapping in the steps below
+            subtask_by_id = _index_subtasks(input_data.plan)
             
             # Step 1: Analyze API mappings and plan code structure
             self.logger.info("Step 1: Analyzing code requirements...")
-            code_analysis = self._analyze_code_requirements(input_data.api_mappings, input_data.plan)
+            code_analysis = self._analyze_code_requirements(input_data.api_mappings, input_data.plan, subtask_by_id)
             self.logger.info(f"Code analysis completed: {code_analysis}")
             
-            # Step 2: Generate script components
+            # Step 2: Generate script components directly into the output buffer
             self.logger.info("Step 2: Generating script components...")
-            script_components = await self._generate_script_components(
+            script_buffer = io.StringIO()
+            written_components = await self._generate_script_components(
+                script_buffer,
                 input_data.api_mappings,
                 input_data.plan,
-                input_data.execution_context
+                input_data.execution_context,
+                code_analysis,
+                subtask_by_id
             )
-            self.logger.info(f"Script components generated: {list(script_components.keys())}")
+            self.logger.info(f"Script components generated: {written_components}")
             
             # Step 3: Assemble complete script
             self.logger.info("Step 3: Assembling complete script...")
             complete_script = self._assemble_complete_script(
-                script_components,
+                script_buffer,
                 code_analysis,
                 input_data
             )
@@ -312,14 +687,14 @@ if bpy.context.mode != 'OBJECT':
                 code_analysis
             )
             
-            generation_time = (time.time() - start_time) * 1000
+            generation_time = (time.perf_counter_ns() - start_time) / 1_000_000
             
             # Create generated script object
             generated_script = GeneratedScript(
-                script_id=f"script_{int(time.time())}",
+                script_id=f"script_{time.time_ns():x}",  # unique even within the same second
                 plan_id=input_data.plan.plan_id,
                 python_code=complete_script,
-                api_calls_count=sum(len(mapping.api_calls) for mapping in input_data.api_mappings),
+                api_calls_count=code_analysis["total_api_calls"],
                 estimated_execution_time_seconds=execution_metadata["estimated_execution_time"],
                 dependencies=execution_metadata["dependencies"],
                 created_objects_estimate=execution_metadata["created_objects_estimate"],
@@ -337,7 +712,8 @@ if bpy.context.mode != 'OBJECT':
                     "generation_time_ms": generation_time,
                     "code_analysis": code_analysis,
                     "validation_results": validation_results,
-                    "lines_of_code": len(complete_script.split('\n'))
+                    # Counted once by validation (newlines + 1) - no split() copy of the script
+                    "lines_of_code": validation_results["metrics"]["total_lines"]
                 },
                 generated_script=generated_script
             )
@@ -345,15 +721,15 @@ if bpy.context.mode != 'OBJECT':
         except Exception as e:
             import traceback
             error_details = traceback.format_exc()
-            self.logger.error(f"Code generation failed: {e}")
-            self.logger.error(f"Full traceback: {error_details}")
+            self.logger.exception("Code generation failed: %s", e)
             
-            # Log additional debugging info
-            self.logger.error(f"Number of API mappings: {len(input_data.api_mappings)}")
-            for i, mapping in enumerate(input_data.api_mappings):
-                self.logger.error(f"Mapping {i}: subtask_id={mapping.subtask_id}, api_calls={len(mapping.api_calls)}")
-                for j, api_call in enumerate(mapping.api_calls):
-                    self.logger.error(f"  API Call {j}: {api_call}")
+            # Log additional debugging info (one line per API call, so only when debugging)
+            self.logger.error("Number of API mappings: %d", len(input_data.api_mappings))
+            if self.logger.isEnabledFor(logging.DEBUG):
+                for i, mapping in enumerate(input_data.api_mappings):
+                    self.logger.debug("Mapping %d: subtask_id=%s, api_calls=%d", i, mapping.subtask_id, len(mapping.api_calls))
+                    for j, api_call in enumerate(mapping.api_calls):
+                        self.logger.debug("  API Call %d: %s", j, api_call)
             
             return CoderOutput(
                 agent_type=AgentType.CODER,
@@ -363,90 +739,141 @@ if bpy.context.mode != 'OBJECT':
                 errors=[str(e), error_details]
             )
     
-    def _analyze_code_requirements(self, api_mappings: List[APIMapping], plan: TaskPlan) -> Dict[str, Any]:
+    def _analyze_code_requirements(
+        self,
+        api_mappings: List[APIMapping],
+        plan: TaskPlan,
+        subtask_by_id: Dict[str, SubTask]
+    ) -> Dict[str, Any]:
         """Analyze code requirements from API mappings"""
         
         analysis = {
-            "total_api_calls": sum(len(mapping.api_calls) for mapping in api_mappings),
-            "categories_used": set(),
-            "imports_needed": set(),
+            "total_api_calls": 0,
+            # Insertion-ordered dicts used as ordered sets for deterministic output
+            "categories_used": {},
+            "imports_needed": {},
             "execution_groups": [],
             "dependency_chain": [],
             "complexity_score": 0.0,
             "estimated_objects": 0
         }
         
-        # Analyze each mapping
+        categories_used = analysis["categories_used"]
+        total_api_calls = 0
+        complexity_score = 0.0
+        estimated_objects = 0
+        
+        # Analyze each mapping in a single pass: call counts, categories,
+        # imports, complexity and created objects
         for mapping in api_mappings:
-            for api_call in mapping.api_calls:
+            api_calls = mapping.api_calls
+            total_api_calls += len(api_calls)
+            
+            for api_call in api_calls:
                 # Handle missing category field with fallback
-                category = api_call.get("category", "mesh_operators")
-                analysis["categories_used"].add(category)
-                
-                # Add required imports
-                if category in self.category_imports:
-                    analysis["imports_needed"].update(self.category_imports[category])
+                category = api_call.get("category", _CAT_MESH)
+                categories_used[category] = None
                 
                 # Estimate complexity
-                if "complex" in api_call["api_name"].lower():
-                    analysis["complexity_score"] += 2.0
-                elif "advanced" in api_call["api_name"].lower():
-                    analysis["complexity_score"] += 1.5
+                api_name_lower = api_call["api_name"].lower()
+                if "complex" in api_name_lower:
+                    complexity_score += 2.0
+                elif "advanced" in api_name_lower:
+                    complexity_score += 1.5
                 else:
-                    analysis["complexity_score"] += 1.0
+                    complexity_score += 1.0
+            
+            # Estimate created objects
+            subtask = subtask_by_id.get(mapping.subtask_id)
+            if subtask:
+                if subtask.type in _OBJECT_CREATION_TYPES:
+                    estimated_objects += 1
+                elif subtask.type == TaskType.CREATE_ENVIRONMENT:
+                    estimated_objects += 3
+        
+        # Add required imports - built once from the distinct categories
+        analysis["imports_needed"] = dict.fromkeys(chain.from_iterable(
+            _category_imports_get(category, ()) for category in categories_used
+        ))
+        analysis["total_api_calls"] = total_api_calls
+        analysis["complexity_score"] = complexity_score
+        analysis["estimated_objects"] = estimated_objects
         
         # Group by execution order (respecting dependencies)
         analysis["execution_groups"] = self._plan_execution_groups(api_mappings, plan)
         
-        # Estimate created objects
-        for mapping in api_mappings:
-            subtask = next((st for st in plan.subtasks if st.task_id == mapping.subtask_id), None)
-            if subtask:
-                if subtask.type in [TaskType.CREATE_CHARACTER, TaskType.CREATE_OBJECT, TaskType.CREATE_FURNITURE]:
-                    analysis["estimated_objects"] += 1
-                elif subtask.type == TaskType.CREATE_ENVIRONMENT:
-                    analysis["estimated_objects"] += 3
-        
         return analysis
     
     def _plan_execution_groups(self, api_mappings: List[APIMapping], plan: TaskPlan) -> List[List[str]]:
         """Plan execution groups based on dependencies"""
         
-        # Create dependency graph
-        subtask_deps = {}
-        for subtask in plan.subtasks:
-            subtask_deps[subtask.task_id] = subtask.dependencies
+        # Create dependency graph (Kahn's algorithm, level by level)
+        subtask_deps = {subtask.task_id: subtask.dependencies for subtask in plan.subtasks}
+        
+        # Tasks to schedule, in mapping order; dependencies outside this set are ignored
+        task_ids = list(dict.fromkeys(mapping.subtask_id for mapping in api_mappings))
+        task_set = set(task_ids)
+        
+        indegree: Dict[str, int] = {}
+        dependents: Dict[str, List[str]] = {task_id: [] for task_id in task_ids}
+        for task_id in task_ids:
+            deps = task_set.intersection(subtask_deps.get(task_id, ()))
+            indegree[task_id] = len(deps)
+            for dep in deps:
+                dependents[dep].append(task_id)
         
         # Group subtasks by execution level
         execution_groups = []
-        remaining_tasks = set(mapping.subtask_id for mapping in api_mappings)
+        ready_tasks = [task_id for task_id in task_ids if indegree[task_id] == 0]
+        scheduled = 0
         
-        while remaining_tasks:
-            # Find tasks with no remaining dependencies
-            ready_tasks = []
-            for task_id in remaining_tasks:
-                deps = subtask_deps.get(task_id, [])
-                if not any(dep in remaining_tasks for dep in deps):
-                    ready_tasks.append(task_id)
-            
-            if not ready_tasks:
-                # Circular dependency or error - add remaining tasks
-                ready_tasks = list(remaining_tasks)
-            
+        while ready_tasks:
             execution_groups.append(ready_tasks)
-            remaining_tasks -= set(ready_tasks)
+            scheduled += len(ready_tasks)
+            next_ready = []
+            for task_id in ready_tasks:
+                for child in dependents[task_id]:
+                    indegree[child] -= 1
+                    if indegree[child] == 0:
+                        next_ready.append(child)
+            ready_tasks = next_ready
+        
+        if scheduled < len(task_ids):
+            # Circular dependency or error - add remaining tasks
+            execution_groups.append([task_id for task_id in task_ids if indegree[task_id] > 0])
         
         return execution_groups
     
     async def _generate_script_components(
         self, 
+        buf: io.StringIO,
         api_mappings: List[APIMapping], 
         plan: TaskPlan,
-        execution_context: Dict[str, Any]
-    ) -> Dict[str, str]:
-        """Generate individual script components"""
-        
-        components = {}
+        execution_context: Dict[str, Any],
+        analysis: Dict[str, Any],
+        subtask_by_id: Dict[str, SubTask]
+    ) -> List[str]:
+        """
+        Generate script components and write them into the output buffer
+        
+        Components are written in final script order (class body first, then
+        script-level code) so no intermediate per-component strings need to be
+        kept around and joined afterwards. analysis is the result of
+        _analyze_code_requirements, reused instead of rescanning the mappings,
+        and subtask_by_id the task_id index built by process().
+        Returns the names of the components in the order they were written.
+        """
+        
+        written = []
+        
+        def write_component(name: str, content: str, skip_blank: bool = False):
+            # Script-level parts are dropped when blank (isspace avoids a stripped copy)
+            if skip_blank and (not content or content.isspace()):
+                return
+            if written:
+                buf.write("\n")
+            buf.write(content)
+            written.append(name)
         
         try:
             # Generate header
@@ -466,239 +893,215 @@ if bpy.context.mode != 'OBJECT':
             
             self.logger.info(f"Header template variables: timestamp={timestamp}, original_prompt='{original_prompt}', plan_id='{plan_id}'")
             
-            components["header"] = self.script_templates["header"].format(
-                timestamp=timestamp,
-                original_prompt=original_prompt,
-                plan_id=plan_id
-            )
+            c0, c1, c2, c3 = self._header_chunks
+            write_component("header", "".join((c0, timestamp, c1, original_prompt, c2, plan_id, c3)))
             self.logger.info("Header component generated successfully")
         except Exception as e:
             self.logger.error(f"Header generation failed: {e}")
             raise
         
-        try:
-            # Generate imports
-            self.logger.info("Generating imports component...")
-            all_imports = set()
-            for mapping in api_mappings:
-                for api_call in mapping.api_calls:
-                    # Handle missing category field with fallback
-                    category = api_call.get("category", "mesh_operators")  # Default fallback
-                    if category in self.category_imports:
-                        all_imports.update(self.category_imports[category])
-                    else:
-                        # If category not found, add default mesh operations import
-                        all_imports.update(self.category_imports.get("mesh_operators", ["bpy.ops.mesh"]))
-            
-            additional_imports = "\n".join(f"import {imp}" for imp in sorted(all_imports))
-            components["imports"] = self.script_templates["imports"].format(
-                additional_imports=additional_imports
-            )
-            self.logger.info("Imports component generated successfully")
-        except Exception as e:
-            self.logger.error(f"Imports generation failed: {e}")
-            raise
-        
         try:
             # Generate setup
             self.logger.info("Generating setup component...")
-            components["setup"] = self.script_templates["setup"]
+            write_component("setup", self.script_templates["setup"])
             self.logger.info("Setup component generated successfully")
         except Exception as e:
             self.logger.error(f"Setup generation failed: {e}")
             raise
         
         try:
-            # Generate main execution methods
-            self.logger.info("Generating execution methods component...")
-            components["execution_methods"] = await self._generate_execution_methods(api_mappings, plan)
-            self.logger.info("Execution methods component generated successfully")
+            # Generate error handling
+            self.logger.info("Generating error handling component...")
+            write_component("error_handling", self.script_templates["error_handling"])
+            self.logger.info("Error handling component generated successfully")
         except Exception as e:
-            self.logger.error(f"Execution methods generation failed: {e}")
+            self.logger.error(f"Error handling generation failed: {e}")
             raise
         
         try:
             # Generate cleanup
             self.logger.info("Generating cleanup component...")
-            components["cleanup"] = self.script_templates["cleanup"]
+            write_component("cleanup", self.script_templates["cleanup"])
             self.logger.info("Cleanup component generated successfully")
         except Exception as e:
             self.logger.error(f"Cleanup generation failed: {e}")
             raise
         
         try:
-            # Generate error handling
-            self.logger.info("Generating error handling component...")
-            components["error_handling"] = self.script_templates["error_handling"]
-            self.logger.info("Error handling component generated successfully")
+            # Generate main execution methods
+            self.logger.info("Generating execution methods component...")
+            write_component("execution_methods", await self._generate_execution_methods(api_mappings, plan, subtask_by_id))
+            self.logger.info("Execution methods component generated successfully")
         except Exception as e:
-            self.logger.error(f"Error handling generation failed: {e}")
+            self.logger.error(f"Execution methods generation failed: {e}")
             raise
         
         try:
             # Generate main execution function
+            # The execute_plan method belongs to the class body, while the
+            # _MAIN_FOOTER block is script-level and goes after the imports
             self.logger.info("Generating main execution component...")
-            components["main_execution"] = self._generate_main_execution(api_mappings, plan)
+            write_component("main_execution", self._generate_main_execution(api_mappings, plan))
             self.logger.info("Main execution component generated successfully")
         except Exception as e:
             self.logger.error(f"Main execution generation failed: {e}")
             raise
         
-        return components
+        try:
+            # Generate imports (script-level, outside the class)
+            self.logger.info("Generating imports component...")
+            # Categories come from the analysis pass; unknown ones fall back to
+            # the default mesh operations imports
+            categories_seen = dict.fromkeys(
+                category if category in _CATEGORY_IMPORTS else _CAT_MESH
+                for category in analysis["categories_used"]
+            )
+            
+            write_component("imports", self._build_imports_block(tuple(categories_seen)), skip_blank=True)
+            self.logger.info("Imports component generated successfully")
+        except Exception as e:
+            self.logger.error(f"Imports generation failed: {e}")
+            raise
+        
+        write_component("main_script_block", _MAIN_FOOTER)
+        
+        return written
     
-    async def _generate_execution_methods(self, api_mappings: List[APIMapping], plan: TaskPlan) -> str:
+    def _build_imports_block(self, categories: Tuple[str, ...]) -> str:
+        """Build the imports component for the given categories"""
+        
+        all_imports = set(chain.from_iterable(
+            _category_imports_get(category, ("bpy.ops.mesh",)) for category in categories
+        ))
+        
+        additional_imports = "\n".join(f"import {imp}" for imp in sorted(all_imports))
+        imports_head, imports_tail = self._imports_chunks
+        return imports_head + additional_imports + imports_tail
+    
+    async def _generate_execution_methods(
+        self,
+        api_mappings: List[APIMapping],
+        plan: TaskPlan,
+        subtask_by_id: Dict[str, SubTask]
+    ) -> str:
         """Generate execution methods for each subtask"""
         
-        methods = []
+        # Formatted methods (and their separators), joined once at the end
+        parts: List[str] = []
         
         for mapping in api_mappings:
             # Find corresponding subtask
-            subtask = next((st for st in plan.subtasks if st.task_id == mapping.subtask_id), None)
+            subtask = subtask_by_id.get(mapping.subtask_id)
             if not subtask:
                 continue
             
-            method_name = f"execute_{mapping.subtask_id.replace('-', '_')}"
-            method_code = f'''
-    def {method_name}(self):
-        """Execute subtask: {subtask.title}"""
-        self.log_info("Starting subtask: {subtask.title}")
-        
-        try:'''
+            # Bind per-subtask invariants once
+            task_id_us = mapping.subtask_id.translate(_SUBTASK_ID_TRANS)
+            subtask_type = subtask.type
+            title = subtask.title
+            
+            # Methods are separated by a blank line
+            if parts:
+                parts.append("\n")
             
             # Check if this is a material application subtask
-            is_material_subtask = (subtask.type == TaskType.MATERIAL_APPLICATION or 
-                                 "material" in subtask.title.lower() or 
-                                 "color" in subtask.title.lower())
+            title_lower = title.lower()
+            is_material_subtask = (subtask_type == TaskType.MATERIAL_APPLICATION or 
+                                 "material" in title_lower or 
+                                 "color" in title_lower)
             
             if is_material_subtask:
                 # Generate proper material creation workflow instead of raw API calls
-                color_info = self._extract_color_from_text(subtask.title + " " + subtask.description)
-                object_type = self._extract_object_type_from_text(subtask.title + " " + subtask.description)
-                method_code += f'''
-            
-            # Create object and apply material with color for {subtask.title}
-            # First ensure we have an object to apply material to
-            if not bpy.context.active_object:
-                # Create a basic object if none exists
-                bpy.ops.mesh.{object_type}()
-                self.log_info(f"Created {{'{object_type}'}} object for material application")
-            
-            if bpy.context.active_object:
-                material_name = "Material_{subtask.task_id.replace('-', '_')}"
-                material = self.create_material_safely(material_name, {color_info})
-                if material:
-                    success = self.apply_material_safely(bpy.context.active_object.name, material)
-                    if success:
-                        self.log_info(f"Applied {{material_name}} with color {color_info} to {{bpy.context.active_object.name}}")
-                        # Track the created object
-                        self.add_created_object(bpy.context.active_object.name, "material_object")
-                    else:
-                        self.log_error(f"Failed to apply material {{material_name}}")
-                        return False
-                else:
-                    self.log_error(f"Failed to create material {{material_name}}")
-                    return False
-            else:
-                self.log_error("No active object available for material application")
-                return False'''
+                subtask_text = title + " " + subtask.description
+                color_info = self._extract_color_from_text(subtask_text)
+                object_type = self._extract_object_type_from_text(subtask_text)
+                body = _MATERIAL_METHOD_TPL.format(
+                    title=title,
+                    task_id_us=task_id_us,
+                    color_info=color_info,
+                    object_type=object_type
+                )
             else:
                 # Add regular API calls for non-material subtasks
-                # But ensure we always create visible objects
-                has_object_creation = any("primitive" in api_call.get("api_name", "") for api_call in mapping.api_calls)
+                # Single pass: emit the API call fragments while checking for object creation
+                api_fragments = []
+                has_object_creation = False
+                for i, api_call in enumerate(mapping.api_calls):
+                    api_name = api_call["api_name"]
+                    if not has_object_creation and "primitive" in api_name:
+                        has_object_creation = True
+                    api_fragments.append(_APICALL_FRAG_HEAD)
+                    api_fragments.append(str(i + 1))
+                    api_fragments.append(self._api_call_fragment(api_call, api_name))
                 
+                # But ensure we always create visible objects
                 if not has_object_creation:
                     # If no object creation APIs, add a default visible object
-                    object_type = self._extract_object_type_from_text(subtask.title + " " + subtask.description)
-                    method_code += f'''
-            
-            # Create visible object for {subtask.title}
-            success = self.safe_execute_api(
-                "bpy.ops.mesh.{object_type}",
-                {{"radius": 2.0, "location": [0, 0, 0]}}
-            )
-            
-            if not success:
-                self.log_error(f"Failed to create object")
-                return False
-            
-            # Track the created object
-            if bpy.context.active_object:
-                self.add_created_object(bpy.context.active_object.name, "generated_object")'''
+                    object_type = self._extract_object_type_from_text(title + " " + subtask.description)
+                    api_fragments.insert(0, _DEFAULT_OBJECT_TPL.format(title=title, object_type=object_type))
                 
-                for i, api_call in enumerate(mapping.api_calls):
-                    api_name = api_call["api_name"]
-                    parameters = api_call["parameters"]
-                    
-                    # Ensure size parameters are reasonable for visibility
-                    if "radius" in parameters and isinstance(parameters["radius"], (int, float)):
-                        if parameters["radius"] < 1.0:
-                            parameters["radius"] = 2.0  # Make objects visible
-                    
-                    # Clean parameters for code generation
-                    clean_params = self._clean_parameters_for_code(parameters)
-                    
-                    method_code += f'''
-            
-            # API Call {i+1}: {api_name}
-            # Description: {api_call.get("description", "No description")}
-            success = self.safe_execute_api(
-                "{api_name}",
-                {clean_params}
-            )
-            
-            if not success:
-                self.log_error(f"Failed to execute {api_name}")
-                return False'''
-            
-
-            
-            # Add object tracking if this creates objects
-            if subtask.type in [TaskType.CREATE_CHARACTER, TaskType.CREATE_OBJECT, TaskType.CREATE_FURNITURE]:
-                method_code += f'''
-            
-            # Track created object
-            if bpy.context.active_object:
-                self.add_created_object(
-                    bpy.context.active_object.name,
-                    "{subtask.type.value}"
-                )'''
-            
-            method_code += f'''
+                body = "".join(api_fragments)
             
-            self.log_info("Completed subtask: {subtask.title}")
-            return True
-            
-        except Exception as e:
-            self.log_error(f"Subtask {subtask.title} failed: {{str(e)}}")
-            return False
-'''
-            
-            methods.append(method_code)
+            # Assemble the method in one format; object tracking only for
+            # subtasks that create objects
+            parts.append(_METHOD_TPL.format(
+                task_id_us=task_id_us,
+                title=title,
+                body=body,
+                tracking=_OBJECT_TRACKING_CODE.get(subtask_type, "")
+            ))
+        
+        return "".join(parts)
+    
+    def _api_call_fragment(self, api_call: Dict[str, Any], api_name: str) -> str:
+        """Code for one API call after its index (memoized per distinct call)"""
+        
+        description = api_call.get("description", "No description")
+        parameters = api_call["parameters"]
+        
+        # Repeated calls (e.g. select_all DESELECT between steps) reuse the
+        # fragment. dict.__repr__ runs in C and, for the builtin types parameters
+        # arrive as, tells apart every input that formats differently (1 / 1.0 /
+        # True, 0.0 / -0.0, list / tuple, key order). A '<' marks an id-based
+        # default repr (<object at 0x...>), which can be reused by a different
+        # object, so those aren't cached; nor are non-str names/descriptions,
+        # since e.g. 1 and True hash equal
+        cache_key = None
+        if type(api_name) is str and type(description) is str:
+            params_repr = repr(parameters)
+            if '<' not in params_repr:
+                cache_key = (api_name, description, params_repr)
+                cached = self._fragment_cache.get(cache_key)
+                if cached is not None:
+                    self._fragment_cache.move_to_end(cache_key)
+                    return cached
+        
+        # Ensure size parameters are reasonable for visibility
+        parameters = _sanitize_params(parameters)
+        
+        # Clean parameters for code generation
+        clean_params = self._clean_parameters_for_code(parameters)
+        
+        fragment = _APICALL_FRAG_TPL.format(
+            api_name=api_name,
+            description=description,
+            clean_params=clean_params
+        )
         
-        return "\n".join(methods)
+        if cache_key is not None:
+            if len(self._fragment_cache) >= self._fragment_cache_maxsize:
+                self._fragment_cache.popitem(last=False)
+            self._fragment_cache[cache_key] = fragment
+        return fragment
     
     def _extract_color_from_text(self, text: str) -> tuple:
         """Extract color information from text description"""
-        text_lower = text.lower()
         
-        # Common color mappings to RGB values
-        color_map = {
-            'red': (1.0, 0.0, 0.0, 1.0),
-            'green': (0.0, 1.0, 0.0, 1.0),
-            'blue': (0.0, 0.0, 1.0, 1.0),
-            'yellow': (1.0, 1.0, 0.0, 1.0),
-            'orange': (1.0, 0.5, 0.0, 1.0),
-            'purple': (0.5, 0.0, 1.0, 1.0),
-            'pink': (1.0, 0.0, 0.5, 1.0),
-            'brown': (0.6, 0.3, 0.1, 1.0),
-            'black': (0.0, 0.0, 0.0, 1.0),
-            'white': (1.0, 1.0, 1.0, 1.0),
-            'gray': (0.5, 0.5, 0.5, 1.0),
-            'grey': (0.5, 0.5, 0.5, 1.0)
-        }
+        text_lower = text.lower()
         
-        # Search for color keywords in text
-        for color_name, rgb_value in color_map.items():
+        # Search for color keywords in text (plain substring checks beat an
+        # IGNORECASE regex alternation, which sre can't prefix-scan)
+        for color_name, rgb_value in _COLOR_RGBA.items():
             if color_name in text_lower:
                 return rgb_value
         
@@ -707,24 +1110,11 @@ if bpy.context.mode != 'OBJECT':
     
     def _extract_object_type_from_text(self, text: str) -> str:
         """Extract object type from text description for mesh creation"""
-        text_lower = text.lower()
         
-        # Object type mappings to Blender mesh primitives
-        object_map = {
-            'ball': 'primitive_uv_sphere_add',
-            'sphere': 'primitive_uv_sphere_add',
-            'cube': 'primitive_cube_add',
-            'box': 'primitive_cube_add',
-            'cylinder': 'primitive_cylinder_add',
-            'cone': 'primitive_cone_add',
-            'mug': 'primitive_cylinder_add',
-            'cup': 'primitive_cylinder_add',
-            'chair': 'primitive_cube_add',
-            'table': 'primitive_cube_add'
-        }
+        text_lower = text.lower()
         
-        # Search for object keywords in text
-        for object_name, mesh_type in object_map.items():
+        # Search for object keywords in text (see _extract_color_from_text)
+        for object_name, mesh_type in _OBJECT_PRIMITIVES.items():
             if object_name in text_lower:
                 return mesh_type
         
@@ -732,136 +1122,51 @@ if bpy.context.mode != 'OBJECT':
         return 'primitive_uv_sphere_add'
     
     def _clean_parameters_for_code(self, parameters: Dict[str, Any]) -> str:
-        """Clean parameters for code generation"""
-        
-        clean_params = {}
-        
-        for key, value in parameters.items():
-            if isinstance(value, str):
-                clean_params[key] = f'"{value}"'
-            elif isinstance(value, (list, tuple)):
-                clean_params[key] = str(tuple(value))
-            elif isinstance(value, dict):
-                clean_params[key] = str(value)
-            else:
-                clean_params[key] = value
+        """Clean parameters for code generation (format as a Python dict literal)"""
         
-        # Format as Python dict
-        param_items = [f'"{k}": {v}' for k, v in clean_params.items()]
-        return "{" + ", ".join(param_items) + "}"
+        return "{" + ", ".join(
+            f'"{key}": {_PARAM_VALUE_FORMATTERS.get(type(value), _format_parameter_value)(value)}'
+            for key, value in parameters.items()
+        ) + "}"
     
     def _generate_main_execution(self, api_mappings: List[APIMapping], plan: TaskPlan) -> str:
-        """Generate main execution function"""
-        
-        main_code = '''
-    def execute_plan(self, export_path: str = None):
-        """Execute the complete plan"""
-        self.log_info("Starting plan execution...")
-        
-        # Setup scene
-        self.setup_scene()
-        
-        # Execute subtasks in dependency order'''
+        """Generate the execute_plan method (the script-level entry point is _MAIN_FOOTER)"""
         
         # Add execution calls for each subtask
         if api_mappings:
-            for mapping in api_mappings:
-                method_name = f"execute_{mapping.subtask_id.replace('-', '_')}"
-                main_code += f'''
-        
-        # Execute: {mapping.subtask_id}
-        if not self.{method_name}():
-            self.log_error("Failed to execute {mapping.subtask_id}")
-            return False'''
+            subtask_calls = "".join([
+                _EXEC_SUBTASK_TPL.format(
+                    subtask_id=mapping.subtask_id,
+                    task_id_us=mapping.subtask_id.translate(_SUBTASK_ID_TRANS)
+                )
+                for mapping in api_mappings
+            ])
         else:
             # Handle case when no API mappings are available
-            main_code += '''
-        
-        # No API mappings available - this should not happen with proper fallback
-        self.log_error("No API mappings found. Coordinator Agent fallback mechanism failed.")
-        self.log_error("This indicates a critical issue with the API search fallback.")
-        return False'''
+            subtask_calls = _EXEC_PLAN_NO_MAPPINGS
         
-        main_code += '''
-        
-        # Cleanup and export
-        self.cleanup_and_export(export_path)
-        
-        self.log_info("Plan execution completed successfully!")
-        return True
-
-# Main execution
-if __name__ == "__main__":
-    executor = BlenderScriptExecutor()
-    
-    # Get export path from command line arguments or use default
-    export_path = sys.argv[-1] if len(sys.argv) > 1 and sys.argv[-1].endswith('.gltf') else None
-    
-    # Execute the plan
-    success = executor.execute_plan(export_path)
-    
-    if success:
-        print("✅ Script execution completed successfully!")
-    else:
-        print("❌ Script execution failed!")
-        sys.exit(1)
-'''
-        
-        return main_code
+        return _EXEC_PLAN_HEADER + subtask_calls + _EXEC_PLAN_FOOTER
     
     def _assemble_complete_script(
         self, 
-        components: Dict[str, str], 
+        buf: io.StringIO, 
         analysis: Dict[str, Any],
         input_data: CoderInput
     ) -> str:
         """Assemble all components into complete script"""
         
-        # Simple assembly - just join all components in order
-        # The main_execution component already contains both the execute_plan method AND the main execution block
-        # No need for complex splitting that breaks indentation
-        
-        # Split main_execution to separate class method from script-level execution
-        main_execution = components["main_execution"]
-        if "# Main execution" in main_execution:
-            execute_plan_method = main_execution.split("# Main execution")[0]
-            main_script_block = "# Main execution" + main_execution.split("# Main execution")[1]
-        else:
-            execute_plan_method = main_execution
-            main_script_block = ""
-        
-        # Assemble all CLASS components first (everything that should be inside BlenderScriptExecutor class)
-        class_components = [
-            components["header"],           # Class definition and initial methods
-            components["setup"],            # Setup functions (setup_scene method)
-            components["error_handling"],   # Error handling functions
-            components["cleanup"],          # Cleanup functions  
-            components["execution_methods"], # Individual subtask methods
-            execute_plan_method            # execute_plan method only
-        ]
-        
-        # Assemble SCRIPT-LEVEL components (everything outside the class)
-        script_components = [
-            components["imports"],          # Additional imports
-            main_script_block              # Main execution block
-        ]
-        
-        # Join class components
-        class_content = "\n".join(class_components)
-        
-        # Join script components (filter out empty ones)
-        script_content = "\n".join([comp for comp in script_components if comp.strip()])
-        
-        # Combine with proper structure
-        script_parts = [class_content]
-        if script_content:
-            script_parts.append(script_content)
-        
-        return "\n".join(script_parts)
+        # Components were already written to the buffer in final order by
+        # _generate_script_components: class body (header, setup, error handling,
+        # cleanup, subtask methods, execute_plan) followed by the script-level
+        # imports and main execution block
+        return buf.getvalue()
     
     def _validate_generated_code(self, script_code: str) -> Dict[str, Any]:
         """Validate the generated Python code"""
         
+        # The pattern scan works on bytes
+        script_bytes = script_code.encode()
+        
         validation = {
             "passed": True,
             "warnings": [],
@@ -869,8 +1174,27 @@ if __name__ == "__main__":
             "metrics": {}
         }
         
+        # SAFETY CHECK and required components
+        pattern_errors, pattern_warnings = _scan_script_patterns(script_bytes)
+        validation["warnings"].extend(pattern_warnings)
+        
+        # Calculate metrics in a single pass over the lines
+        code_lines = 0
+        comment_lines = 0
+        for line in script_code.splitlines():
+            stripped = line.lstrip()
+            if not stripped:
+                continue
+            if stripped[0] == '#':
+                comment_lines += 1
+            else:
+                code_lines += 1
+        
+        # Basic syntax check
+        # Full compile() rather than ast.parse(): it also catches compile-stage errors
+        # such as 'return' outside function (e.g. from broken template indentation),
+        # and is no slower since ast.parse has to build Python-level AST objects
         try:
-            # Basic syntax check
             compile(script_code, '<generated_script>', 'exec')
             validation["metrics"]["syntax_valid"] = True
             
@@ -879,52 +1203,13 @@ if __name__ == "__main__":
             validation["errors"].append(f"Syntax error: {str(e)}")
             validation["metrics"]["syntax_valid"] = False
         
-        # SAFETY CHECK: Detect dangerous Blender operations that can cause crashes
-        # These patterns are VERY SPECIFIC to avoid blocking legitimate asset creation operations
-        dangerous_patterns = [
-            # UI/Viewport manipulation (CRITICAL - causes crashes)
-            "bpy.ops.view3d.view_selected",  # Viewport navigation - CRASHES BLENDER
-            "bpy.ops.view3d.view_all",       # Viewport navigation - CRASHES BLENDER
-            "bpy.ops.view3d.view_center_cursor", # Viewport navigation - CRASHES BLENDER
-            "bpy.ops.view3d.view_camera",    # Viewport navigation - CRASHES BLENDER
-            "bpy.context.screen.areas",      # UI screen area access
-            "space.shading.type =",          # Viewport shading assignment
-            "area.type == 'VIEW_3D'",        # UI area detection
-            "space.type == 'VIEW_3D'",       # UI space detection  
-            "bpy.context.window",            # Window management
-            "bpy.context.area.spaces",       # UI area space access
-            ".shading.type = 'MATERIAL_PREVIEW'",  # Specific viewport shading change
-            ".shading.type = 'RENDERED'",    # Specific viewport shading change
-            "for area in bpy.context.screen", # Screen area iteration
-            # Additional dangerous viewport operations
-            "bpy.ops.screen.",               # Screen operations
-            "bpy.ops.wm.window",             # Window manager operations
-            "bpy.context.area.type",         # Area type manipulation
-            "bpy.context.space_data"         # Space data manipulation
-        ]
-        
-        for pattern in dangerous_patterns:
-            if pattern in script_code:
-                validation["passed"] = False
-                validation["errors"].append(f"FORBIDDEN OPERATION: Script contains dangerous Blender UI manipulation: '{pattern}'. Scripts must ONLY create 3D assets, not manipulate viewport/UI settings.")
-        
-        # Check for required components
-        required_components = [
-            "import bpy",
-            "class BlenderScriptExecutor",
-            "def execute_plan",
-            "if __name__ == \"__main__\""
-        ]
-        
-        for component in required_components:
-            if component not in script_code:
-                validation["warnings"].append(f"Missing component: {component}")
-        
-        # Calculate metrics
-        lines = script_code.split('\n')
-        validation["metrics"]["total_lines"] = len(lines)
-        validation["metrics"]["code_lines"] = len([l for l in lines if l.strip() and not l.strip().startswith('#')])
-        validation["metrics"]["comment_lines"] = len([l for l in lines if l.strip().startswith('#')])
+        validation["metrics"]["total_lines"] = script_code.count('\n') + 1
+        validation["metrics"]["code_lines"] = code_lines
+        validation["metrics"]["comment_lines"] = comment_lines
+        
+        if pattern_errors:
+            validation["passed"] = False
+            validation["errors"].extend(pattern_errors)
         
         return validation
     
@@ -936,13 +1221,12 @@ if __name__ == "__main__":
         complexity_multiplier = min(analysis["complexity_score"] / 10, 2.0)
         estimated_time = analysis["total_api_calls"] * base_time_per_api * complexity_multiplier
         
-        # Collect dependencies
-        dependencies = ["bpy", "bmesh", "mathutils"]
-        dependencies.extend(analysis["imports_needed"])
+        # Collect dependencies (sorted for stable output)
+        dependencies = sorted(_BASE_DEPENDENCIES.union(analysis["imports_needed"]))
         
         return {
             "estimated_execution_time": estimated_time,
-            "dependencies": list(set(dependencies)),
+            "dependencies": dependencies,
             "created_objects_estimate": analysis["estimated_objects"]
         }
     
@@ -952,6 +1236,6 @@ if __name__ == "__main__":
         return {
             "initialized": self._initialized,
             "templates_loaded": len(self.script_templates),
-            "category_mappings": len(self.category_imports),
+            "category_mappings": len(_CATEGORY_IMPORTS),
             "generation_count": len(self.generation_metrics)
         }
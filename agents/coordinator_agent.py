@@ -3,11 +3,12 @@ Coordinator Agent - Maps subtasks to specific Blender APIs using optimized searc
 Second agent in the multi-agent pipeline for 3D asset generation
 """
 
-import asyncio
 import time
 import logging
-from typing import Dict, List, Optional, Any, Tuple
-from concurrent.futures import ThreadPoolExecutor
+from collections import Counter, deque
+from functools import cached_property
+from types import MappingProxyType
+from typing import Deque, Iterator, Dict, List, Optional, Any, Tuple
 
 from .base_agent import BaseAgent
 from .models import (
@@ -21,7 +22,157 @@ from .api_search import (
     SearchConfig,
     create_search_context
 )
-from .api_search.models import SearchContext, APICategory
+from .api_search.models import APICategory
+
+# Task type to API category mapping
+_TASK_CATEGORY_MAPPING = MappingProxyType({
+    TaskType.CREATE_CHARACTER: (APICategory.MESH_OPERATORS, APICategory.OBJECT_OPERATORS),
+    TaskType.CREATE_OBJECT: (APICategory.MESH_OPERATORS, APICategory.OBJECT_OPERATORS),
+    TaskType.CREATE_FURNITURE: (APICategory.MESH_OPERATORS, APICategory.OBJECT_OPERATORS),
+    TaskType.CREATE_CLOTHING: (APICategory.MESH_OPERATORS, APICategory.GEOMETRY_NODES),
+    TaskType.CREATE_ARCHITECTURE: (APICategory.MESH_OPERATORS, APICategory.OBJECT_OPERATORS),
+    TaskType.CREATE_ENVIRONMENT: (APICategory.OBJECT_OPERATORS, APICategory.SCENE_OPERATORS),
+    TaskType.LIGHTING_SETUP: (APICategory.OBJECT_OPERATORS, APICategory.SCENE_OPERATORS),
+    TaskType.MATERIAL_APPLICATION: (APICategory.SHADER_NODES, APICategory.MATERIAL_OPERATORS),
+    TaskType.SCENE_COMPOSITION: (APICategory.OBJECT_OPERATORS,),
+    TaskType.ANIMATION_SETUP: (APICategory.ANIMATION_OPERATORS, APICategory.OBJECT_OPERATORS),
+    TaskType.POST_PROCESSING: (APICategory.SCENE_OPERATORS,)
+})
+
+# API search strategies by task complexity
+_COMPLEXITY_SEARCH_STRATEGIES = MappingProxyType({
+    "simple": MappingProxyType({"max_results": 3, "min_relevance": 0.7}),
+    "moderate": MappingProxyType({"max_results": 5, "min_relevance": 0.6}),
+    "complex": MappingProxyType({"max_results": 8, "min_relevance": 0.5}),
+    "expert": MappingProxyType({"max_results": 10, "min_relevance": 0.4}),
+})
+
+# Basic API mappings by task type - ONLY VALID BLENDER OPERATIONS
+# Each call is (api_name, parameters, description, execution_order); see _basic_api_calls
+_BASIC_MAPPINGS = MappingProxyType({
+    TaskType.CREATE_OBJECT: (
+        ("bpy.ops.mesh.primitive_uv_sphere_add", (("radius", 1.0), ("location", (0, 0, 0))),
+         "Create UV sphere primitive", 1),
+    ),
+    TaskType.MATERIAL_APPLICATION: (
+        ("bpy.ops.object.select_all", (("action", "SELECT"),),
+         "Select all objects to apply materials", 1),
+    ),
+    TaskType.SCENE_COMPOSITION: (
+        ("bpy.ops.object.select_all", (("action", "SELECT"),),
+         "Select all objects for composition", 1),
+        ("bpy.ops.transform.translate", (("value", (0, 0, 0)),),
+         "Position objects in scene", 2),
+    ),
+})
+
+_DEFAULT_BASIC_MAPPING = (
+    ("bpy.ops.mesh.primitive_cube_add", (("size", 2.0), ("location", (0, 0, 0))),
+     "Create basic cube primitive", 1),
+)
+
+
+def _basic_api_calls(task_type: TaskType) -> List[Dict[str, Any]]:
+    """Build fresh, mutable API call dicts from the frozen basic mapping for a task type"""
+    return [
+        {
+            "api_name": api_name,
+            "parameters": {
+                name: list(value) if isinstance(value, tuple) else value
+                for name, value in parameters
+            },
+            "description": description,
+            "execution_order": execution_order
+        }
+        for api_name, parameters, description, execution_order
+        in _BASIC_MAPPINGS.get(task_type, _DEFAULT_BASIC_MAPPING)
+    ]
+
+# Base API calls per task type, adjusted by complexity multipliers
+_BASE_API_CALLS = {
+    TaskType.CREATE_CHARACTER: 8,
+    TaskType.CREATE_OBJECT: 4,
+    TaskType.CREATE_FURNITURE: 6,
+    TaskType.CREATE_CLOTHING: 7,
+    TaskType.CREATE_ARCHITECTURE: 10,
+    TaskType.CREATE_ENVIRONMENT: 12,
+    TaskType.LIGHTING_SETUP: 3,
+    TaskType.MATERIAL_APPLICATION: 4,
+    TaskType.SCENE_COMPOSITION: 5,
+    TaskType.ANIMATION_SETUP: 6,
+    TaskType.POST_PROCESSING: 3
+}
+
+_COMPLEXITY_MULTIPLIERS = {
+    "simple": 0.7,
+    "moderate": 1.0,
+    "complex": 1.5,
+    "expert": 2.0
+}
+
+# Estimated API calls by (task type, complexity), precomputed from the tables above
+_API_CALL_TABLE = MappingProxyType({
+    (task_type, complexity): int(base * multiplier)
+    for task_type, base in _BASE_API_CALLS.items()
+    for complexity, multiplier in _COMPLEXITY_MULTIPLIERS.items()
+})
+
+# Category pairs that don't mix well within one mapping
+_INCOMPATIBLE_CATEGORY_PAIRS = (
+    frozenset({"mesh_operators", "shader_nodes"}),
+    frozenset({"animation_operators", "material_operators"})
+)
+
+# Groups of mutually compatible API categories
+_COMPATIBLE_CATEGORY_GROUPS = (
+    {"mesh_operators", "object_operators"},
+    {"shader_nodes", "material_operators"},
+    {"animation_operators", "object_operators"},
+    {"geometry_nodes", "mesh_operators"}
+)
+
+# Category -> categories sharing at least one group with it (not transitive)
+_COMPATIBLE_CATEGORIES = MappingProxyType({
+    category: frozenset().union(*(group for group in _COMPATIBLE_CATEGORY_GROUPS if category in group))
+    for category in set().union(*_COMPATIBLE_CATEGORY_GROUPS)
+})
+
+# Category assumed for API calls that don't declare one
+_DEFAULT_API_CATEGORY = "mesh_operators"
+
+
+def _api_category(api_call: Dict[str, Any]) -> str:
+    """Category of an API call dict, defaulting to mesh operators"""
+    return api_call.get("category", _DEFAULT_API_CATEGORY)
+
+
+# Search-query keyword tables: (substrings to look for, queries to add), checked in order
+_TITLE_QUERY_KEYWORDS = (
+    (("mesh primitives",), ("primitive_cube_add", "primitive_cylinder_add", "primitive_uv_sphere_add")),
+    (("chair",), ("primitive_cube_add", "primitive_cylinder_add", "duplicate")),
+    (("human", "character"), ("primitive_cube_add", "primitive_uv_sphere_add", "primitive_cylinder_add")),
+)
+
+_DESCRIPTION_QUERY_KEYWORDS = (
+    (("cube",), ("primitive_cube_add",)),
+    (("sphere",), ("primitive_uv_sphere_add",)),
+    (("cylinder",), ("primitive_cylinder_add",)),
+    (("scale", "resize"), ("resize",)),
+    (("position", "translate"), ("translate",)),
+    (("rotate",), ("rotate",)),
+)
+
+# Task-specific fallback search queries
+_ENHANCED_TASK_QUERIES = MappingProxyType({
+    TaskType.CREATE_CHARACTER: ("primitive_cube_add", "primitive_uv_sphere_add", "primitive_cylinder_add"),
+    TaskType.CREATE_FURNITURE: ("primitive_cube_add", "primitive_cylinder_add", "duplicate"),
+    TaskType.CREATE_CLOTHING: ("cloth", "modifier_add"),
+    TaskType.LIGHTING_SETUP: ("light_add", "sun_add", "area_add"),
+    TaskType.MATERIAL_APPLICATION: ("material_new", "node_add"),
+    TaskType.SCENE_COMPOSITION: ("transform", "translate", "rotate"),
+    TaskType.ANIMATION_SETUP: ("keyframe_insert", "frame_set"),
+})
+
 
 class CoordinatorAgent(BaseAgent):
     """
@@ -52,46 +203,37 @@ class CoordinatorAgent(BaseAgent):
         )
         self.api_searcher = OptimizedAPISearcher(search_config)
         
-        # Initialize LLM-based API mapper
-        try:
-            self.llm_mapper = LLMAPIMapper()
-            self.use_llm_mapping = True
-            self.logger.info("LLM API Mapper initialized successfully")
-        except Exception as e:
-            self.logger.warning(f"LLM API Mapper initialization failed: {e}")
-            self.llm_mapper = None
-            self.use_llm_mapping = False
+        # LLM-based API mapper is created lazily on first use (see llm_mapper)
+        self.use_llm_mapping = True
         
         # Task type to API category mapping
-        self.task_category_mapping = {
-            TaskType.CREATE_CHARACTER: [APICategory.MESH_OPERATORS, APICategory.OBJECT_OPERATORS],
-            TaskType.CREATE_OBJECT: [APICategory.MESH_OPERATORS, APICategory.OBJECT_OPERATORS],
-            TaskType.CREATE_FURNITURE: [APICategory.MESH_OPERATORS, APICategory.OBJECT_OPERATORS],
-            TaskType.CREATE_CLOTHING: [APICategory.MESH_OPERATORS, APICategory.GEOMETRY_NODES],
-            TaskType.CREATE_ARCHITECTURE: [APICategory.MESH_OPERATORS, APICategory.OBJECT_OPERATORS],
-            TaskType.CREATE_ENVIRONMENT: [APICategory.OBJECT_OPERATORS, APICategory.SCENE_OPERATORS],
-            TaskType.LIGHTING_SETUP: [APICategory.OBJECT_OPERATORS, APICategory.SCENE_OPERATORS],
-            TaskType.MATERIAL_APPLICATION: [APICategory.SHADER_NODES, APICategory.MATERIAL_OPERATORS],
-            TaskType.SCENE_COMPOSITION: [APICategory.OBJECT_OPERATORS],
-            TaskType.ANIMATION_SETUP: [APICategory.ANIMATION_OPERATORS, APICategory.OBJECT_OPERATORS],
-            TaskType.POST_PROCESSING: [APICategory.SCENE_OPERATORS]
-        }
+        self.task_category_mapping = _TASK_CATEGORY_MAPPING
         
         # API search strategies by task complexity
-        self.complexity_search_strategies = {
-            "simple": {"max_results": 3, "min_relevance": 0.7},
-            "moderate": {"max_results": 5, "min_relevance": 0.6},
-            "complex": {"max_results": 8, "min_relevance": 0.5},
-            "expert": {"max_results": 10, "min_relevance": 0.4}
-        }
+        self.complexity_search_strategies = _COMPLEXITY_SEARCH_STRATEGIES
         
-        # Thread pool for concurrent API searches
-        self.executor = ThreadPoolExecutor(max_workers=10)
-        
-        # Performance tracking
-        self.coordination_metrics = []
+        # Performance tracking, bounded to the most recent coordinations
+        self.coordination_metrics: Deque[Dict[str, Any]] = deque(
+            maxlen=int(self.config.get("metrics_window", 1000))
+        )
         self._initialized = False
     
+    @cached_property
+    def llm_mapper(self) -> Optional[LLMAPIMapper]:
+        """LLM-based API mapper, initialized on first access (None if unavailable)"""
+        try:
+            # The mapper caches LLM-generated API calls for repeated subtask templates
+            llm_mapper = LLMAPIMapper(
+                cache_size=self.config.get("cache_size", 256),
+                cache_ttl_seconds=self.config.get("ttl", 3600.0)
+            )
+            self.logger.info("LLM API Mapper initialized successfully")
+            return llm_mapper
+        except Exception as e:
+            self.logger.warning(f"LLM API Mapper initialization failed: {e}")
+            self.use_llm_mapping = False
+            return None
+    
     async def initialize(self) -> bool:
         """Initialize the coordinator agent and its search engine"""
         if self._initialized:
@@ -130,17 +272,25 @@ class CoordinatorAgent(BaseAgent):
             
             start_time = time.time()
             
-            # Step 1: Analyze the plan and validate subtasks
-            plan_analysis = await self._analyze_plan(input_data.plan)
-            
-            # Step 2: Generate API mappings for each subtask
+            # Step 1: Generate API mappings for each subtask
             api_mappings = await self._generate_api_mappings(
                 input_data.plan.subtasks, 
                 input_data.execution_context
             )
             
-            # Step 3: Validate API compatibility and workflow coherence
-            validated_mappings = await self._validate_api_mappings(api_mappings, input_data.plan)
+            # Step 2: Analyze the plan and validate subtasks
+            plan_analysis = self._analyze_plan(input_data.plan)
+            
+            # Step 3: Validate API compatibility and workflow coherence,
+            # accumulating totals as validated mappings are streamed back
+            validated_mappings = []
+            total_api_calls = 0
+            total_confidence = 0.0
+            for mapping in self._validate_api_mappings(api_mappings, input_data.plan):
+                validated_mappings.append(mapping)
+                total_api_calls += len(mapping.api_calls)
+                total_confidence += mapping.confidence_score
+            mapping_count = len(validated_mappings)
             
             # Step 4: Generate execution strategy
             execution_strategy = self._generate_execution_strategy(validated_mappings, input_data.plan)
@@ -158,8 +308,8 @@ class CoordinatorAgent(BaseAgent):
                 data={
                     "plan_analysis": plan_analysis,
                     "coordination_time_ms": coordination_time,
-                    "total_api_calls": sum(len(mapping.api_calls) for mapping in validated_mappings),
-                    "avg_confidence": sum(mapping.confidence_score for mapping in validated_mappings) / max(len(validated_mappings), 1)
+                    "total_api_calls": total_api_calls,
+                    "avg_confidence": total_confidence / mapping_count if mapping_count else 0.0
                 },
                 api_mappings=validated_mappings,
                 execution_strategy=execution_strategy,
@@ -176,246 +326,104 @@ class CoordinatorAgent(BaseAgent):
                 errors=[str(e)]
             )
     
-    async def _analyze_plan(self, plan: TaskPlan) -> Dict[str, Any]:
+    def _analyze_plan(self, plan: TaskPlan) -> Dict[str, Any]:
         """Analyze the task plan for coordination insights"""
         
-        analysis = {
-            "total_subtasks": len(plan.subtasks),
-            "task_types": {},
-            "complexity_distribution": {},
-            "estimated_api_calls": 0,
-            "potential_bottlenecks": [],
-            "parallelization_opportunities": []
-        }
+        task_types = Counter()
+        complexity_distribution = Counter()
+        estimated_api_calls = 0
+        potential_bottlenecks = []
+        independent_tasks = []
+        estimate_api_calls = self._estimate_api_calls_for_task
         
-        # Analyze task types
+        # Analyze task types, bottlenecks and independent tasks in a single pass
         for subtask in plan.subtasks:
-            task_type = subtask.type.value
-            analysis["task_types"][task_type] = analysis["task_types"].get(task_type, 0) + 1
-            
             complexity = subtask.complexity.value
-            analysis["complexity_distribution"][complexity] = analysis["complexity_distribution"].get(complexity, 0) + 1
+            task_types[subtask.type.value] += 1
+            complexity_distribution[complexity] += 1
             
             # Estimate API calls needed based on task type and complexity
-            base_calls = self._estimate_api_calls_for_task(subtask)
-            analysis["estimated_api_calls"] += base_calls
-        
-        # Identify potential bottlenecks
-        for subtask in plan.subtasks:
-            if subtask.complexity.value == "expert" and len(subtask.dependencies) > 0:
-                analysis["potential_bottlenecks"].append(subtask.task_id)
-        
-        # Identify parallelization opportunities
-        independent_tasks = [task for task in plan.subtasks if not task.dependencies]
-        if len(independent_tasks) > 1:
-            analysis["parallelization_opportunities"] = [task.task_id for task in independent_tasks]
+            estimated_api_calls += estimate_api_calls(subtask)
+            
+            if subtask.dependencies:
+                # Identify potential bottlenecks
+                if complexity == "expert":
+                    potential_bottlenecks.append(subtask.task_id)
+            else:
+                independent_tasks.append(subtask.task_id)
         
-        return analysis
+        return {
+            "total_subtasks": len(plan.subtasks),
+            "task_types": dict(task_types),
+            "complexity_distribution": dict(complexity_distribution),
+            "estimated_api_calls": estimated_api_calls,
+            "potential_bottlenecks": potential_bottlenecks,
+            # Identify parallelization opportunities
+            "parallelization_opportunities": independent_tasks if len(independent_tasks) > 1 else []
+        }
     
     def _estimate_api_calls_for_task(self, subtask: SubTask) -> int:
         """Estimate number of API calls needed for a subtask"""
-        base_calls = {
-            TaskType.CREATE_CHARACTER: 8,
-            TaskType.CREATE_OBJECT: 4,
-            TaskType.CREATE_FURNITURE: 6,
-            TaskType.CREATE_CLOTHING: 7,
-            TaskType.CREATE_ARCHITECTURE: 10,
-            TaskType.CREATE_ENVIRONMENT: 12,
-            TaskType.LIGHTING_SETUP: 3,
-            TaskType.MATERIAL_APPLICATION: 4,
-            TaskType.SCENE_COMPOSITION: 5,
-            TaskType.ANIMATION_SETUP: 6,
-            TaskType.POST_PROCESSING: 3
-        }
-        
-        base = base_calls.get(subtask.type, 5)
-        
-        # Adjust based on complexity
-        complexity_multipliers = {
-            "simple": 0.7,
-            "moderate": 1.0,
-            "complex": 1.5,
-            "expert": 2.0
-        }
-        
-        multiplier = complexity_multipliers.get(subtask.complexity.value, 1.0)
-        return int(base * multiplier)
+        return _API_CALL_TABLE.get((subtask.type, subtask.complexity.value), 5)
     
     async def _generate_api_mappings(
         self, 
         subtasks: List[SubTask], 
         execution_context: Dict[str, Any]
     ) -> List[APIMapping]:
-        """Generate API mappings for all subtasks concurrently"""
-        
-        # Create mapping tasks for concurrent execution
-        mapping_tasks = []
-        for subtask in subtasks:
-            task = self._map_subtask_to_apis(subtask, execution_context)
-            mapping_tasks.append(task)
-        
-        # Execute all mappings concurrently
-        api_mappings = await asyncio.gather(*mapping_tasks, return_exceptions=True)
-        
-        # Filter out exceptions and log errors
-        valid_mappings = []
-        for i, mapping in enumerate(api_mappings):
-            if isinstance(mapping, Exception):
-                self.logger.error(f"Failed to map subtask {subtasks[i].task_id}: {mapping}")
-            else:
-                valid_mappings.append(mapping)
+        """Generate API mappings for all subtasks, streaming batched LLM results"""
         
-        return valid_mappings
-    
-    async def _map_subtask_to_apis(
-        self, 
-        subtask: SubTask, 
-        execution_context: Dict[str, Any]
-    ) -> APIMapping:
-        """Map a single subtask to specific Blender APIs using LLM or fallback to search"""
-        
-        # Try LLM-based mapping first (preferred approach)
-        if self.use_llm_mapping and self.llm_mapper:
+        llm_api_mappings = {}
+        llm_mapper = self.llm_mapper if self.use_llm_mapping and subtasks else None
+        if llm_mapper is not None:
+            # The mapper serves cached subtasks, batches requests and retries unmapped subtasks on its own
+            subtasks_by_id = {subtask.task_id: subtask for subtask in subtasks}
             try:
-                self.logger.info(f"Using LLM to map subtask: {subtask.title}")
-                
-                # Get LLM-generated API calls
-                llm_api_calls = await self.llm_mapper.map_subtask_to_apis(subtask)
-                
-                if llm_api_calls:
-                    # Convert LLM response to APIMapping format
-                    api_calls = []
-                    for call in llm_api_calls:
-                        api_calls.append({
-                            "api_name": call["api_name"],
-                            "parameters": call["parameters"],
-                            "description": call["description"],
-                            "execution_order": call.get("execution_order", len(api_calls) + 1)
-                        })
-                    
-                    # Create APIMapping object
-                    api_mapping = APIMapping(
-                        subtask_id=subtask.task_id,
-                        api_calls=api_calls,
-                        execution_strategy="sequential",
-                        estimated_execution_time=len(api_calls) * 2.0,  # 2 seconds per API call
-                        dependencies=[],
-                        resource_requirements={"memory_mb": 100, "cpu_cores": 1},
-                        mcp_server="blender_api_server"  # Add required mcp_server field
-                    )
-                    
-                    self.logger.info(f"LLM successfully mapped {len(api_calls)} API calls for subtask {subtask.task_id}")
-                    return api_mapping
-                    
+                self.logger.info("Using LLM to map %d subtasks", len(subtasks))
+                async for task_id, llm_api_calls in llm_mapper.iter_subtask_mappings(subtasks):
+                    if llm_api_calls:
+                        llm_api_mappings[task_id] = self._build_llm_api_mapping(subtasks_by_id[task_id], llm_api_calls)
             except Exception as e:
-                self.logger.warning(f"LLM mapping failed for subtask {subtask.task_id}: {e}")
-                # Fall through to traditional search approach
-        
-        # Fallback to traditional search-based mapping
-        self.logger.info(f"Using traditional search for subtask: {subtask.title}")
-        
-        # ROBUST FALLBACK: Generate basic API mappings based on task type
-        return self._generate_basic_api_mapping(subtask)
-        
-        # Get preferred API categories for this task type
-        preferred_categories = self.task_category_mapping.get(subtask.type, [APICategory.MESH_OPERATORS])
+                self.logger.warning("LLM mapping failed: %s", e)
         
-        # Get search strategy based on complexity
-        search_params = self.complexity_search_strategies.get(
-            subtask.complexity.value, 
-            {"max_results": 5, "min_relevance": 0.6}
-        )
-        
-        # Create search context
-        search_context = SearchContext(
-            task_type=subtask.type.value,
-            task_description=subtask.description,
-            preferred_categories=preferred_categories,
-            max_results=search_params["max_results"],
-            min_relevance=search_params["min_relevance"],
-            enable_semantic_search=True
-        )
-        
-        # Generate search queries from subtask
-        search_queries = self._generate_search_queries(subtask)
-        
-        # Search for APIs using multiple queries
-        all_api_results = []
-        for query in search_queries:
-            try:
-                results = await self.api_searcher.search(query, search_context)
-                all_api_results.extend(results)
-            except Exception as e:
-                self.logger.warning(f"Search failed for query '{query}': {e}")
-        
-        # Deduplicate and rank results
-        unique_apis = self._deduplicate_and_rank_apis(all_api_results)
-        
-        # Convert to API calls with parameters
-        api_calls = self._convert_to_api_calls(unique_apis, subtask, execution_context)
-        
-        # Calculate confidence score
-        confidence_score = self._calculate_mapping_confidence(unique_apis, subtask)
-        
-        # Generate alternatives
-        alternatives = self._generate_alternative_mappings(unique_apis[3:], subtask)
+        # ROBUST FALLBACK: basic API mappings for anything the LLM didn't map
+        return [
+            llm_api_mappings.get(subtask.task_id) or self._generate_basic_api_mapping(subtask)
+            for subtask in subtasks
+        ]
+    
+    def _build_llm_api_mapping(self, subtask: SubTask, llm_api_calls: List[Dict[str, Any]]) -> APIMapping:
+        """Convert LLM-generated API calls for a subtask to APIMapping format"""
         
-        return APIMapping(
+        api_calls = []
+        for call in llm_api_calls:
+            api_calls.append({
+                "api_name": call["api_name"],
+                "parameters": call["parameters"],
+                "description": call["description"],
+                "execution_order": call.get("execution_order", len(api_calls) + 1)
+            })
+        
+        api_mapping = APIMapping(
             subtask_id=subtask.task_id,
-            mcp_server=self._determine_mcp_server(preferred_categories[0] if preferred_categories else APICategory.MESH_OPERATORS),
             api_calls=api_calls,
-            confidence_score=confidence_score,
-            alternatives=alternatives
+            execution_strategy="sequential",
+            estimated_execution_time=len(api_calls) * 2.0,  # 2 seconds per API call
+            dependencies=[],
+            resource_requirements={"memory_mb": 100, "cpu_cores": 1},
+            mcp_server="blender_api_server"  # Add required mcp_server field
         )
+        
+        self.logger.info("LLM successfully mapped %d API calls for subtask %s", len(api_calls), subtask.task_id)
+        return api_mapping
     
     def _generate_basic_api_mapping(self, subtask: SubTask) -> APIMapping:
         """Generate basic API mapping when LLM and complex search fail - ROBUST FALLBACK"""
         
-        self.logger.info(f"Generating basic API mapping for {subtask.type.value}: {subtask.title}")
-        
-        # Basic API mappings based on task type - ONLY VALID BLENDER OPERATIONS
-        basic_mappings = {
-            TaskType.CREATE_OBJECT: [
-                {
-                    "api_name": "bpy.ops.mesh.primitive_uv_sphere_add",
-                    "parameters": {"radius": 1.0, "location": [0, 0, 0]},
-                    "description": "Create UV sphere primitive",
-                    "execution_order": 1
-                }
-            ],
-            TaskType.MATERIAL_APPLICATION: [
-                {
-                    "api_name": "bpy.ops.object.select_all",
-                    "parameters": {"action": "SELECT"},
-                    "description": "Select all objects to apply materials",
-                    "execution_order": 1
-                }
-            ],
-            TaskType.SCENE_COMPOSITION: [
-                {
-                    "api_name": "bpy.ops.object.select_all",
-                    "parameters": {"action": "SELECT"},
-                    "description": "Select all objects for composition",
-                    "execution_order": 1
-                },
-                {
-                    "api_name": "bpy.ops.transform.translate",
-                    "parameters": {"value": [0, 0, 0]},
-                    "description": "Position objects in scene",
-                    "execution_order": 2
-                }
-            ]
-        }
+        self.logger.info("Generating basic API mapping for %s: %s", subtask.type.value, subtask.title)
         
         # Get basic API calls for this task type
-        api_calls = basic_mappings.get(subtask.type, [
-            {
-                "api_name": "bpy.ops.mesh.primitive_cube_add",
-                "parameters": {"size": 2.0, "location": [0, 0, 0]},
-                "description": "Create basic cube primitive",
-                "execution_order": 1
-            }
-        ])
+        api_calls = _basic_api_calls(subtask.type)
         
         return APIMapping(
             subtask_id=subtask.task_id,
@@ -433,84 +441,58 @@ class CoordinatorAgent(BaseAgent):
         """Generate enhanced search queries from granular subtask information"""
         
         queries = []
+        append_query = queries.append
+        mesh_operations = getattr(subtask, 'mesh_operations', None)
+        context = subtask.context
+        title = subtask.title
+        description = subtask.description
         
         # Priority 1: Extract specific mesh operations (highest priority for granular subtasks)
-        if hasattr(subtask, 'mesh_operations') and subtask.mesh_operations:
-            for operation in subtask.mesh_operations:
+        if mesh_operations:
+            for operation in mesh_operations:
                 # Convert our format to Blender API format
                 if operation.startswith('mesh.'):
-                    queries.append(operation.replace('.', '.ops.'))  # mesh.primitive_cube_add → mesh.ops.primitive_cube_add
+                    append_query(operation.replace('.', '.ops.'))  # mesh.primitive_cube_add → mesh.ops.primitive_cube_add
                 elif operation.startswith('transform.'):
-                    queries.append(operation.replace('.', '.ops.'))  # transform.resize → transform.ops.resize
+                    append_query(operation.replace('.', '.ops.'))  # transform.resize → transform.ops.resize
                 else:
-                    queries.append(operation)
+                    append_query(operation)
         
         # Priority 2: Extract specific APIs from context
-        if subtask.context and 'specific_apis_needed' in subtask.context:
-            api_list = subtask.context['specific_apis_needed']
+        if context and 'specific_apis_needed' in context:
+            api_list = context['specific_apis_needed']
             for api in api_list:
                 # Extract the operation part: bpy.ops.mesh.primitive_cube_add → primitive_cube_add
                 if 'bpy.ops.' in api:
                     operation = api.split('bpy.ops.')[-1]
-                    queries.append(operation)
+                    append_query(operation)
                 else:
-                    queries.append(api)
+                    append_query(api)
         
         # Priority 3: Enhanced title-based queries
-        if subtask.title:
-            title_lower = subtask.title.lower()
+        if title:
+            title_lower = title.lower()
             # Extract key operations from title
-            if "mesh primitives" in title_lower:
-                queries.extend(["primitive_cube_add", "primitive_cylinder_add", "primitive_uv_sphere_add"])
-            if "chair" in title_lower:
-                queries.extend(["primitive_cube_add", "primitive_cylinder_add", "duplicate"])
-            if "human" in title_lower or "character" in title_lower:
-                queries.extend(["primitive_cube_add", "primitive_uv_sphere_add", "primitive_cylinder_add"])
+            for keywords, keyword_queries in _TITLE_QUERY_KEYWORDS:
+                if any(keyword in title_lower for keyword in keywords):
+                    queries.extend(keyword_queries)
         
         # Priority 4: Enhanced description-based queries  
-        if subtask.description:
-            desc_lower = subtask.description.lower()
+        if description:
+            desc_lower = description.lower()
             # Extract Blender-specific keywords
-            blender_keywords = []
-            if "cube" in desc_lower:
-                blender_keywords.append("primitive_cube_add")
-            if "sphere" in desc_lower:
-                blender_keywords.append("primitive_uv_sphere_add")
-            if "cylinder" in desc_lower:
-                blender_keywords.append("primitive_cylinder_add")
-            if "scale" in desc_lower or "resize" in desc_lower:
-                blender_keywords.append("resize")
-            if "position" in desc_lower or "translate" in desc_lower:
-                blender_keywords.append("translate")
-            if "rotate" in desc_lower:
-                blender_keywords.append("rotate")
-            
-            queries.extend(blender_keywords)
+            for keywords, keyword_queries in _DESCRIPTION_QUERY_KEYWORDS:
+                if any(keyword in desc_lower for keyword in keywords):
+                    queries.extend(keyword_queries)
         
         # Priority 5: Task-specific fallback queries (enhanced)
-        enhanced_task_queries = {
-            TaskType.CREATE_CHARACTER: ["primitive_cube_add", "primitive_uv_sphere_add", "primitive_cylinder_add"],
-            TaskType.CREATE_FURNITURE: ["primitive_cube_add", "primitive_cylinder_add", "duplicate"],
-            TaskType.CREATE_CLOTHING: ["cloth", "modifier_add"],
-            TaskType.LIGHTING_SETUP: ["light_add", "sun_add", "area_add"],
-            TaskType.MATERIAL_APPLICATION: ["material_new", "node_add"],
-            TaskType.SCENE_COMPOSITION: ["transform", "translate", "rotate"],
-            TaskType.ANIMATION_SETUP: ["keyframe_insert", "frame_set"]
-        }
-        
-        if subtask.type in enhanced_task_queries:
-            queries.extend(enhanced_task_queries[subtask.type])
+        task_queries = _ENHANCED_TASK_QUERIES.get(subtask.type)
+        if task_queries:
+            queries.extend(task_queries)
         
-        # Remove duplicates while preserving order
-        seen = set()
-        unique_queries = []
-        for query in queries:
-            if query not in seen:
-                seen.add(query)
-                unique_queries.append(query)
-        
-        # Limit to top 8 queries (increased from 5 for better coverage)
-        return unique_queries[:8]
+        # Remove duplicates while preserving order, limited to top 8 queries
+        # (increased from 5 for better coverage)
+        return list(dict.fromkeys(queries))[:8]
     
     def _deduplicate_and_rank_apis(self, api_results) -> List:
         """Remove duplicates and rank APIs by relevance"""
@@ -664,57 +646,42 @@ class CoordinatorAgent(BaseAgent):
         
         return server_mapping.get(category, "blender-mesh")
     
-    async def _validate_api_mappings(
+    def _validate_api_mappings(
         self, 
         api_mappings: List[APIMapping], 
         plan: TaskPlan
-    ) -> List[APIMapping]:
-        """Validate API mappings for compatibility and coherence"""
-        
-        validated_mappings = []
+    ) -> Iterator[APIMapping]:
+        """Validate API mappings for compatibility and coherence, yielding each valid mapping"""
         
         for mapping in api_mappings:
             # Basic validation
             if not mapping.api_calls:
-                self.logger.warning(f"No API calls found for subtask {mapping.subtask_id}")
+                self.logger.warning("No API calls found for subtask %s", mapping.subtask_id)
                 continue
             
             # Confidence threshold validation
             if mapping.confidence_score < 0.3:
-                self.logger.warning(f"Low confidence mapping for subtask {mapping.subtask_id}: {mapping.confidence_score}")
+                self.logger.warning("Low confidence mapping for subtask %s: %s", mapping.subtask_id, mapping.confidence_score)
                 # Still include but mark as low confidence
             
             # API compatibility validation
             if self._validate_api_compatibility(mapping):
-                validated_mappings.append(mapping)
+                yield mapping
             else:
-                self.logger.warning(f"API compatibility issues for subtask {mapping.subtask_id}")
+                self.logger.warning("API compatibility issues for subtask %s", mapping.subtask_id)
                 # Try to fix or provide alternatives
                 fixed_mapping = self._attempt_mapping_fix(mapping)
                 if fixed_mapping:
-                    validated_mappings.append(fixed_mapping)
-        
-        return validated_mappings
+                    yield fixed_mapping
     
     def _validate_api_compatibility(self, mapping: APIMapping) -> bool:
         """Validate that APIs in a mapping are compatible"""
         
         # Check that all APIs are from compatible categories
-        categories = set()
-        for api_call in mapping.api_calls:
-            categories.add(api_call.get("category", "mesh_operators"))
+        categories = {_api_category(api_call) for api_call in mapping.api_calls}
         
         # Some categories don't mix well
-        incompatible_pairs = [
-            {"mesh_operators", "shader_nodes"},
-            {"animation_operators", "material_operators"}
-        ]
-        
-        for incompatible in incompatible_pairs:
-            if incompatible.issubset(categories):
-                return False
-        
-        return True
+        return not any(incompatible <= categories for incompatible in _INCOMPATIBLE_CATEGORY_PAIRS)
     
     def _attempt_mapping_fix(self, mapping: APIMapping) -> Optional[APIMapping]:
         """Attempt to fix a problematic API mapping"""
@@ -722,40 +689,33 @@ class CoordinatorAgent(BaseAgent):
         # For now, just filter out incompatible APIs
         # In a more sophisticated version, this could use ML or heuristics
         
-        filtered_calls = []
-        primary_category = None
+        api_calls = mapping.api_calls
+        if not api_calls:
+            return None
         
         # Determine primary category from first API
-        if mapping.api_calls:
-            primary_category = mapping.api_calls[0].get("category", "mesh_operators")
+        primary_category = _api_category(api_calls[0])
+        compatible = _COMPATIBLE_CATEGORIES.get(primary_category, ())
         
         # Keep only APIs from compatible categories
-        for api_call in mapping.api_calls:
-            if self._are_categories_compatible(primary_category, api_call.get("category", "mesh_operators")):
+        filtered_calls = []
+        for api_call in api_calls:
+            category = _api_category(api_call)
+            if category in compatible or category == primary_category:
                 filtered_calls.append(api_call)
         
-        if filtered_calls:
-            mapping.api_calls = filtered_calls
-            mapping.confidence_score *= 0.8  # Reduce confidence for fixed mapping
+        # Nothing was incompatible, so there is nothing to fix or penalize
+        if len(filtered_calls) == len(api_calls):
             return mapping
         
-        return None
+        # The primary API itself is always kept, so filtered_calls is never empty here
+        mapping.api_calls = filtered_calls
+        mapping.confidence_score *= 0.8  # Reduce confidence for fixed mapping
+        return mapping
     
     def _are_categories_compatible(self, cat1: str, cat2: str) -> bool:
         """Check if two API categories are compatible"""
-        
-        compatible_groups = [
-            {"mesh_operators", "object_operators"},
-            {"shader_nodes", "material_operators"},
-            {"animation_operators", "object_operators"},
-            {"geometry_nodes", "mesh_operators"}
-        ]
-        
-        for group in compatible_groups:
-            if cat1 in group and cat2 in group:
-                return True
-        
-        return cat1 == cat2
+        return cat2 in _COMPATIBLE_CATEGORIES.get(cat1, ()) or cat1 == cat2
     
     def _generate_execution_strategy(
         self, 
@@ -764,48 +724,51 @@ class CoordinatorAgent(BaseAgent):
     ) -> str:
         """Generate execution strategy description"""
         
-        total_apis = sum(len(mapping.api_calls) for mapping in api_mappings)
-        avg_confidence = sum(mapping.confidence_score for mapping in api_mappings) / max(len(api_mappings), 1)
+        total_apis = 0
+        total_confidence = 0.0
+        for mapping in api_mappings:
+            total_apis += len(mapping.api_calls)
+            total_confidence += mapping.confidence_score
+        avg_confidence = total_confidence / max(len(api_mappings), 1)
         
         # Determine strategy based on plan characteristics
         if len(plan.parallel_groups) > 1:
-            strategy = f"Parallel execution strategy with {len(plan.parallel_groups)} groups"
+            parts = [f"Parallel execution strategy with {len(plan.parallel_groups)} groups"]
         else:
-            strategy = "Sequential execution strategy"
+            parts = ["Sequential execution strategy"]
         
-        strategy += f" involving {total_apis} API calls across {len(api_mappings)} subtasks"
-        strategy += f" with average confidence {avg_confidence:.2f}"
+        parts.append(f" involving {total_apis} API calls across {len(api_mappings)} subtasks")
+        parts.append(f" with average confidence {avg_confidence:.2f}")
         
         # Add recommendations
         if avg_confidence < 0.6:
-            strategy += ". Recommend manual review of low-confidence mappings."
+            parts.append(". Recommend manual review of low-confidence mappings.")
         
         if total_apis > 50:
-            strategy += ". Consider breaking down into smaller execution batches."
+            parts.append(". Consider breaking down into smaller execution batches.")
         
-        return strategy
+        return "".join(parts)
     
     def _calculate_resource_requirements(self, api_mappings: List[APIMapping]) -> Dict[str, Any]:
         """Calculate estimated resource requirements"""
         
-        total_apis = sum(len(mapping.api_calls) for mapping in api_mappings)
+        # Count APIs by category for server load balancing, and in total
+        category_counts = Counter()
+        total_apis = 0
+        for mapping in api_mappings:
+            for api_call in mapping.api_calls:
+                category_counts[_api_category(api_call)] += 1
+                total_apis += 1
         
         # Estimate based on API count and complexity
         estimated_memory_mb = total_apis * 2  # Rough estimate: 2MB per API call
         estimated_execution_time_seconds = total_apis * 0.5  # Rough estimate: 0.5s per API call
         
-        # Count APIs by category for server load balancing
-        category_counts = {}
-        for mapping in api_mappings:
-            for api_call in mapping.api_calls:
-                category = api_call.get("category", "mesh_operators")
-                category_counts[category] = category_counts.get(category, 0) + 1
-        
         return {
             "estimated_memory_mb": estimated_memory_mb,
             "estimated_execution_time_seconds": estimated_execution_time_seconds,
             "total_api_calls": total_apis,
-            "api_calls_by_category": category_counts,
+            "api_calls_by_category": dict(category_counts),
             "recommended_parallel_workers": min(len(api_mappings), 5),
             "mcp_servers_needed": list(set(mapping.mcp_server for mapping in api_mappings))
         }
@@ -814,11 +777,14 @@ class CoordinatorAgent(BaseAgent):
         """Get coordination performance statistics"""
         
         search_stats = self.api_searcher.get_performance_stats()
+        # Don't create the mapper just to report on its cache
+        llm_mapper = self.__dict__.get("llm_mapper")
         
         return {
             "coordinator_initialized": self._initialized,
             "api_search_stats": search_stats,
             "total_coordinations": len(self.coordination_metrics),
+            "mapping_cache_stats": llm_mapper.get_cache_stats() if llm_mapper is not None else {},
             "search_engine_memory_mb": search_stats.get("memory_usage_mb", 0)
         }
     
@@ -839,8 +805,3 @@ class CoordinatorAgent(BaseAgent):
             health["search_engine_memory_mb"] = search_health.get("memory_usage_mb", 0)
         
         return health
-    
-    def __del__(self):
-        """Cleanup resources"""
-        if hasattr(self, 'executor'):
-            self.executor.shutdown(wait=False)
@@ -4,13 +4,18 @@ Inspired by EAG-V17's model_manager.py approach
 """
 
 import asyncio
+import copy
+import hashlib
 import json
 import logging
 import os
+import re
+import threading
+import time
+from collections import OrderedDict
 from pathlib import Path
-from typing import List, Dict, Any, Optional
-import json
-import asyncio
+from types import MappingProxyType
+from typing import AsyncIterator, Hashable, List, Dict, Any, Optional, Tuple
 from dotenv import load_dotenv
 import google.generativeai as genai
 from .base_agent import BaseAgent
@@ -18,15 +23,309 @@ from .models import SubTask, APIMapping
 from .simple_validator import SimpleAPIValidator
 from prompts import APIMapperPrompts
 
+# Valid Blender API operations (guaranteed to work)
+_VALID_APIS = {
+    "mesh_creation": [
+        "bpy.ops.mesh.primitive_cube_add",
+        "bpy.ops.mesh.primitive_uv_sphere_add", 
+        "bpy.ops.mesh.primitive_cylinder_add",
+        "bpy.ops.mesh.primitive_cone_add"
+    ],
+    "transformations": [
+        "bpy.ops.transform.translate",
+        "bpy.ops.transform.rotate", 
+        "bpy.ops.transform.resize"
+    ],
+    "object_ops": [
+        "bpy.ops.object.select_all",
+        "bpy.ops.object.duplicate_move"
+    ],
+    "material_ops": [
+        # Core material operations
+        "bpy.ops.material.new",
+        "bpy.ops.material.copy", 
+        "bpy.ops.material.paste",
+        
+        # Object material slot operations
+        "bpy.ops.object.material_slot_add",
+        "bpy.ops.object.material_slot_assign",
+        "bpy.ops.object.material_slot_copy",
+        "bpy.ops.object.material_slot_deselect",
+        "bpy.ops.object.material_slot_move",
+        "bpy.ops.object.material_slot_remove",
+        "bpy.ops.object.material_slot_remove_unused",
+        "bpy.ops.object.material_slot_select"
+    ]
+}
+
+# Flattened for the per-call substring check in _validate_api_calls
+_VALID_API_NAMES = tuple(api for group in _VALID_APIS.values() for api in group)
+
+# Ask Gemini for a bare JSON body instead of markdown-fenced text
+_JSON_GENERATION_CONFIG = {"response_mime_type": "application/json"}
+
+# Precompiled patterns for _clean_json_response
+_RE_FENCE_JSON_OPEN = re.compile(r'^```json\s*', re.MULTILINE)
+_RE_FENCE_OPEN = re.compile(r'^```\s*', re.MULTILINE)
+_RE_FENCE_CLOSE = re.compile(r'```$', re.MULTILINE)
+_RE_JSON_OBJECT = re.compile(r'\{.*\}', re.DOTALL)
+_RE_TUPLE_ARRAY = re.compile(r'\((\s*[-\d\.\s,]+\s*)\)')
+_RE_API_DATA_MATERIALS = re.compile(r'"api_name":\s*"bpy\.data\.materials\[[^\]]+\][^"]*"')
+_RE_API_MATERIAL_NEW = re.compile(r'"api_name":\s*"bpy\.ops\.material\.new"')
+_RE_API_VIEW3D = re.compile(r'"api_name":\s*"bpy\.ops\.view3d\.[^"]*"')
+_RE_SINGLE_QUOTED = re.compile(r"'([^']*)'")
+_RE_MATERIAL_REFERENCE = re.compile(r'"material":\s*bpy\.data\.materials\[[^\]]+\]')
+_RE_API_OBJ = re.compile(r'"api_name":\s*"bpy\.ops\.obj[^"]*"')
+_RE_TRAILING_COMMA = re.compile(r',(\s*[}\]])')
+_RE_VALUE_ON_NEXT_LINE = re.compile(r':\s*\n')
+
+# Substrings that make some _clean_json_response step rewrite its input
+_CLEAN_JSON_TRIGGERS = (
+    '```', '(', "'", 'None', 'True', 'False',
+    'bpy.data.materials', 'bpy.ops.material.new', 'bpy.ops.view3d', 'bpy.ops.obj',
+)
+
+# Fallback API call templates used when the LLM can't map a subtask.
+# Each call is (api_name, parameters, description, execution_order); see _fallback_api_calls.
+# CREATE_OBJECT picks the first keyword group found in the subtask title/description.
+_FALLBACK_OBJECT_TEMPLATES = (
+    # Coffee mug/cup detection
+    (('mug', 'cup', 'coffee', 'tea'), (
+        ("bpy.ops.mesh.primitive_cylinder_add",
+         (("radius", 0.8), ("depth", 1.2), ("location", (0, 0, 0))),
+         "Create cylinder body for {title}", 1),
+        ("bpy.ops.mesh.primitive_torus_add",
+         (("major_radius", 0.6), ("minor_radius", 0.1), ("location", (1.0, 0, 0.3))),
+         "Create torus handle for {title}", 2),
+    )),
+    # Chair detection
+    (('chair', 'seat', 'stool'), (
+        ("bpy.ops.mesh.primitive_cube_add", (("size", 1.0), ("location", (0, 0, 0.5))),
+         "Create seat for {title}", 1),
+        ("bpy.ops.mesh.primitive_cube_add", (("size", 1.0), ("location", (0, -0.4, 1.2))),
+         "Create backrest for {title}", 2),
+    )),
+    # Ball/sphere detection
+    (('ball', 'sphere', 'globe', 'orb'), (
+        ("bpy.ops.mesh.primitive_uv_sphere_add", (("radius", 1.0), ("location", (0, 0, 0))),
+         "Create sphere for {title}", 1),
+    )),
+    # Table detection
+    (('table', 'desk', 'surface'), (
+        ("bpy.ops.mesh.primitive_cube_add", (("size", 2.0), ("location", (0, 0, 1.0))),
+         "Create table top for {title}", 1),
+    )),
+)
+
+# Default fallback - cylinder (more versatile than cube)
+_FALLBACK_DEFAULT_OBJECT_TEMPLATE = (
+    ("bpy.ops.mesh.primitive_cylinder_add",
+     (("radius", 1.0), ("depth", 2.0), ("location", (0, 0, 0))),
+     "Create basic cylindrical object for {title}", 1),
+)
+
+_FALLBACK_TYPE_TEMPLATES = MappingProxyType({
+    # Basic material creation and application
+    "APPLY_MATERIAL": (
+        ("bpy.data.materials.new", (("name", "BasicMaterial"),),
+         "Create basic material", 1),
+        ("bpy.context.object.data.materials.append", (("material", "BasicMaterial"),),
+         "Apply material to active object", 2),
+    ),
+    "ADD_TEXT": (
+        ("bpy.ops.object.text_add", (("location", (0, 0, 0)),),
+         "Add text for {title}", 1),
+    ),
+})
+
+
+def _fallback_api_calls(templates, title: str) -> List[Dict[str, Any]]:
+    """Build fresh, mutable API call dicts from frozen fallback templates for a subtask title"""
+    return [
+        {
+            "api_name": api_name,
+            "parameters": {
+                name: list(value) if isinstance(value, tuple) else value
+                for name, value in parameters
+            },
+            "description": description.format(title=title),
+            "execution_order": execution_order
+        }
+        for api_name, parameters, description, execution_order in templates
+    ]
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Cap on the raw response written to the debug dump
+_DEBUG_DUMP_MAX_CHARS = 64 * 1024
+
+# Responses at least this long are cleaned and parsed off the event loop
+_OFFLOAD_PARSE_MIN_CHARS = 16 * 1024
+
+
+def _json_loads(text: str) -> Any:
+    """Parse JSON with orjson when available, deferring to json for anything it rejects"""
+    if ORJSON_AVAILABLE:
+        try:
+            return orjson.loads(text)
+        except orjson.JSONDecodeError:
+            # json accepts a few things orjson doesn't (NaN, huge ints); keep its errors too
+            pass
+    return json.loads(text)
+
+
+class MappingCache:
+    """
+    Thread-safe LRU cache with TTL for LLM-generated API calls
+    
+    Keyed by a digest of the subtask's mapping prompt, so only subtasks the
+    LLM would see identically share an entry.
+    """
+    
+    def __init__(self, max_size: int = 256, ttl_seconds: float = 3600.0):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, Tuple[float, List[Dict[str, Any]]]]" = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def get(self, key: Hashable) -> Optional[List[Dict[str, Any]]]:
+        """Return a copy of the cached API calls, or None if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            
+            stored_at, api_calls = entry
+            if time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                self.evictions += 1
+                self.misses += 1
+                return None
+            
+            self._entries.move_to_end(key)
+            self.hits += 1
+        
+        # Callers may mutate parameters downstream, so never hand out the stored lists
+        return copy.deepcopy(api_calls)
+    
+    def put(self, key: Hashable, api_calls: List[Dict[str, Any]], age_seconds: float = 0.0) -> None:
+        """Store API calls for a key, evicting the least recently used entry when full"""
+        if self.max_size <= 0 or age_seconds > self.ttl_seconds:
+            return
+        
+        api_calls = copy.deepcopy(api_calls)
+        with self._lock:
+            self._entries[key] = (time.monotonic() - age_seconds, api_calls)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def snapshot(self) -> List[Tuple[Hashable, float, List[Dict[str, Any]]]]:
+        """Get (key, age in seconds, API calls) for every unexpired entry, oldest first"""
+        now = time.monotonic()
+        with self._lock:
+            return [
+                (key, now - stored_at, api_calls)
+                for key, (stored_at, api_calls) in self._entries.items()
+                if now - stored_at <= self.ttl_seconds
+            ]
+    
+    def clear(self) -> None:
+        """Drop all cached entries"""
+        with self._lock:
+            self._entries.clear()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache statistics"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+
+# Caches loaded from JSONL sidecars, shared by every mapper using the same file
+_sidecar_caches: Dict[Path, MappingCache] = {}
+_sidecar_caches_lock = threading.Lock()
+
+
+def _load_sidecar_cache(cache_path: Path, max_size: int, ttl_seconds: float) -> MappingCache:
+    """Load (once per process) the mapping cache persisted to a JSONL sidecar"""
+    with _sidecar_caches_lock:
+        cache = _sidecar_caches.get(cache_path)
+        if cache is not None:
+            return cache
+        
+        cache = MappingCache(max_size=max_size, ttl_seconds=ttl_seconds)
+        _sidecar_caches[cache_path] = cache
+        if not cache_path.exists():
+            return cache
+        
+        lines_read = 0
+        now = time.time()
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    lines_read += 1
+                    try:
+                        entry = json.loads(line)
+                        cache.put(bytes.fromhex(entry["k"]), entry["v"], age_seconds=now - entry["t"])
+                    except (ValueError, KeyError, TypeError):
+                        continue  # Skip truncated or malformed lines
+        except OSError as e:
+            print(f"⚠️ Could not load LLM mapping cache {cache_path}: {e}")
+            return cache
+        
+        # The sidecar is append-only; drop superseded, expired, evicted and malformed lines
+        if lines_read > cache.get_stats()["size"]:
+            _compact_sidecar(cache_path, cache)
+        return cache
+
+
+def _compact_sidecar(cache_path: Path, cache: MappingCache) -> None:
+    """Rewrite a JSONL sidecar with just the entries currently cached"""
+    tmp_path = cache_path.with_name(cache_path.name + ".tmp")
+    now = time.time()
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for key, age_seconds, api_calls in cache.snapshot():
+                f.write(json.dumps({"k": key.hex(), "t": now - age_seconds, "v": api_calls}) + "\n")
+        os.replace(tmp_path, cache_path)
+    except (OSError, TypeError, ValueError) as e:
+        print(f"⚠️ Could not compact LLM mapping cache {cache_path}: {e}")
+
+
 class LLMAPIMapper:
     """
     LLM-powered API mapper that converts granular subtasks to specific Blender API calls
     """
     
-    def __init__(self, model_name: str = "gemini-1.5-flash"):
+    def __init__(
+        self,
+        model_name: str = "gemini-1.5-flash",
+        cache_size: int = 4096,
+        cache_ttl_seconds: float = 3600.0
+    ):
         """Initialize the LLM API Mapper with Gemini"""
         
         # Initialize Gemini client
@@ -37,35 +336,71 @@ class LLMAPIMapper:
         genai.configure(api_key=api_key)
         self.model_name = model_name
         
+        # The base template is identical for every request, so send it once as
+        # the system instruction and only the subtask context per call
+        system_prompt = APIMapperPrompts.get_base_prompt_template()
+        self._model = genai.GenerativeModel(model_name, system_instruction=system_prompt)
+        # Batched requests need the {"mappings": [...]} output format in their
+        # system instruction rather than the single-subtask one
+        self._batch_model = genai.GenerativeModel(
+            model_name, system_instruction=APIMapperPrompts.get_batch_prompt_template()
+        )
+        # Cache keys cover the model and system instruction, so a shared sidecar
+        # never serves one model's mappings to another
+        self._prompt_digest = hashlib.blake2b(digest_size=16)
+        self._prompt_digest.update(model_name.encode('utf-8') + b'\0')
+        self._prompt_digest.update(system_prompt.encode('utf-8'))
+        
+        # Bound in-flight Gemini requests so large batches don't trip rate limits
+        self._gemini_sem = asyncio.Semaphore(int(os.getenv("GEMINI_MAX_CONCURRENCY", "5")))
+        
         # Initialize simple API validator
         self.api_validator = SimpleAPIValidator()
         
-        # Load Blender API registry for context
-        self.api_registry_path = Path(__file__).parent.parent / "blender_api_registry.json"
-        self.api_context = self._load_api_context()
+        # Validated API calls by subtask prompt digest, optionally persisted to a JSONL
+        # sidecar; a sidecar-backed cache is loaded off the event loop on first use
+        self._llm_cache_size = cache_size
+        self._llm_cache_ttl = cache_ttl_seconds
+        cache_file = os.getenv("LLM_MAPPING_CACHE_FILE")
+        self._llm_cache_path = Path(cache_file).resolve() if cache_file else None
+        self._llm_cache: Optional[MappingCache] = (
+            None if self._llm_cache_path else MappingCache(cache_size, cache_ttl_seconds)
+        )
+    
+    async def _ensure_llm_cache(self) -> MappingCache:
+        """Get the mapping cache, loading the JSONL sidecar in a worker thread if needed"""
+        if self._llm_cache is None:
+            self._llm_cache = await asyncio.to_thread(
+                _load_sidecar_cache, self._llm_cache_path, self._llm_cache_size, self._llm_cache_ttl
+            )
+        return self._llm_cache
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """Get mapping cache statistics (empty until a sidecar-backed cache is loaded)"""
+        return self._llm_cache.get_stats() if self._llm_cache is not None else {}
+    
+    def _llm_cache_key(self, subtask: SubTask) -> bytes:
+        """Digest of model, system instruction and the subtask's prompt body"""
+        prompt_digest = self._prompt_digest.copy()
+        prompt_digest.update(APIMapperPrompts.create_subtask_body(subtask).encode('utf-8'))
+        return prompt_digest.digest()
+    
+    def _store_llm_result(self, key: bytes, api_calls: List[Dict[str, Any]]) -> None:
+        """Cache validated API calls and append them to the sidecar"""
+        self._llm_cache.put(key, api_calls)
+        self._persist_llm_result(key, api_calls)
+    
+    def _persist_llm_result(self, key: bytes, api_calls: List[Dict[str, Any]]) -> None:
+        """Append a cache entry to the JSONL sidecar, if configured"""
+        if self._llm_cache_path is None:
+            return
         
-    def _load_api_context(self) -> str:
-        """Load a subset of Blender API context for the LLM"""
         try:
-            if self.api_registry_path.exists():
-                with open(self.api_registry_path, 'r') as f:
-                    registry = json.load(f)
-                
-                # Extract commonly used APIs for context
-                common_apis = []
-                for category, apis in registry.items():
-                    if isinstance(apis, list):
-                        # Get first 10 APIs from each category as examples
-                        for api in apis[:10]:
-                            if isinstance(api, dict) and 'name' in api:
-                                common_apis.append(f"- {api['name']}: {api.get('description', 'No description')}")
-                
-                return "\n".join(common_apis[:50])  # Limit to 50 examples
-            else:
-                return "Blender API registry not found. Using general Blender knowledge."
-        except Exception as e:
-            return f"Error loading API context: {str(e)}"
-    
+            with open(self._llm_cache_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({"k": key.hex(), "t": time.time(), "v": api_calls}) + "\n")
+        except (OSError, TypeError, ValueError) as e:
+            print(f"⚠️ Could not persist LLM mapping cache entry: {e}")
+        
     async def map_subtask_to_apis(self, subtask: SubTask) -> List[Dict[str, Any]]:
         """
         Map a granular subtask to specific Blender API calls using LLM
@@ -77,6 +412,13 @@ class LLMAPIMapper:
             List of API call dictionaries with name, parameters, and description
         """
         
+        # Identical prompts map to identical calls, so reuse an earlier response
+        llm_cache = await self._ensure_llm_cache()
+        cache_key = self._llm_cache_key(subtask)
+        cached_calls = llm_cache.get(cache_key)
+        if cached_calls is not None:
+            return cached_calls
+        
         # Create detailed prompt for the LLM
         prompt = self._create_mapping_prompt(subtask)
         
@@ -85,7 +427,13 @@ class LLMAPIMapper:
             response = await self._gemini_generate(prompt)
             
             # Parse the response into structured API calls
-            api_calls = self._parse_llm_response(response)
+            if len(response) >= _OFFLOAD_PARSE_MIN_CHARS:
+                api_calls = await asyncio.to_thread(self._parse_llm_response, response)
+            else:
+                api_calls = self._parse_llm_response(response)
+            
+            if api_calls:
+                self._store_llm_result(cache_key, api_calls)
             
             return api_calls
             
@@ -94,15 +442,110 @@ class LLMAPIMapper:
             # Fallback to basic mapping
             return self._fallback_mapping(subtask)
     
+    async def map_subtasks_to_apis(self, subtasks: List[SubTask]) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Map several subtasks to Blender API calls with a single LLM request
+        
+        Args:
+            subtasks: The granular subtasks to map
+            
+        Returns:
+            Dictionary of validated API calls by task_id. Subtasks the LLM
+            skipped or answered unusably are left out so callers can map
+            them individually.
+        """
+        # Serve cached subtasks directly; only the rest go into the request
+        llm_cache = await self._ensure_llm_cache()
+        mapping_results = {}
+        cache_keys = {}
+        uncached = []
+        for subtask in subtasks:
+            cache_key = self._llm_cache_key(subtask)
+            cached_calls = llm_cache.get(cache_key)
+            if cached_calls is not None:
+                mapping_results[subtask.task_id] = cached_calls
+            else:
+                cache_keys[subtask.task_id] = cache_key
+                uncached.append(subtask)
+        
+        if not uncached:
+            return mapping_results
+        
+        prompt = APIMapperPrompts.create_batch_body(uncached)
+        
+        try:
+            response = await self._gemini_generate(prompt, self._batch_model)
+            if len(response) >= _OFFLOAD_PARSE_MIN_CHARS:
+                batched = await asyncio.to_thread(self._parse_batch_llm_response, response, uncached)
+            else:
+                batched = self._parse_batch_llm_response(response, uncached)
+            
+        except Exception as e:
+            print(f"Batched LLM API mapping failed for {len(uncached)} subtasks: {e}")
+            return mapping_results
+        
+        for task_id, api_calls in batched.items():
+            self._store_llm_result(cache_keys[task_id], api_calls)
+            mapping_results[task_id] = api_calls
+        
+        return mapping_results
+    
+    def _parse_batch_llm_response(self, response: str, subtasks: List[SubTask]) -> Dict[str, List[Dict[str, Any]]]:
+        """Parse a batched LLM response into API calls by task_id"""
+        
+        # Well-formed responses (the norm in JSON mode) are parsed once, uncleaned
+        data = self._load_clean_json(response.strip())
+        if data is None:
+            cleaned_response = self._clean_json_response(response)
+            try:
+                data = _json_loads(cleaned_response)
+            except json.JSONDecodeError:
+                data = _json_loads(self._aggressive_json_fix(cleaned_response))
+        
+        if isinstance(data, dict):
+            if "mappings" in data:
+                data = data["mappings"]
+            elif "api_calls" in data:
+                # A single-subtask reply can only be attributed when the batch had one subtask
+                data = {subtasks[0].task_id: data["api_calls"]} if len(subtasks) == 1 else {}
+        
+        # Accept both [{"task_id": ..., "api_calls": [...]}] and {"<task_id>": [...]}
+        if isinstance(data, list):
+            entries = (
+                (entry.get("task_id"), entry.get("api_calls"))
+                for entry in data if isinstance(entry, dict)
+            )
+        elif isinstance(data, dict):
+            entries = (
+                (task_id, calls.get("api_calls") if isinstance(calls, dict) else calls)
+                for task_id, calls in data.items()
+            )
+        else:
+            raise ValueError(f"Batched mappings must be a JSON array or object, got: {type(data)}")
+        
+        requested_ids = {subtask.task_id for subtask in subtasks}
+        mapping_results = {}
+        for task_id, api_calls in entries:
+            if task_id in requested_ids and isinstance(api_calls, list):
+                validated_calls = self._validate_api_calls(api_calls)
+                if validated_calls:
+                    mapping_results[task_id] = validated_calls
+        
+        print(f"✅ Batched mapping returned API calls for {len(mapping_results)}/{len(requested_ids)} subtasks")
+        return mapping_results
+    
     def _create_mapping_prompt(self, subtask: SubTask) -> str:
-        """Create a detailed prompt for LLM to map subtask to Blender APIs"""
-        return APIMapperPrompts.create_subtask_mapping_prompt(subtask)
+        """Create the per-subtask prompt; the base template is the model's system instruction"""
+        return APIMapperPrompts.create_subtask_body(subtask)
     
-    async def _gemini_generate(self, prompt: str) -> str:
-        """Generate content using Gemini LLM"""
+    async def _gemini_generate(self, prompt: str, model: Optional[Any] = None) -> str:
+        """Generate content using Gemini LLM (the single-subtask model by default)"""
+        model = model or self._model
         try:
-            model = genai.GenerativeModel(self.model_name)
-            response = await model.generate_content_async(prompt)
+            async with self._gemini_sem:
+                response = await model.generate_content_async(
+                    prompt, generation_config=_JSON_GENERATION_CONFIG
+                )
             return response.text.strip()
             
         except Exception as e:
@@ -110,21 +553,20 @@ class LLMAPIMapper:
     
     def _clean_json_response(self, response: str) -> str:
         """Comprehensive JSON cleaning for LLM responses - PROVEN SOLUTION"""
-        import re
         
         # Step 1: Remove markdown code blocks
         response = response.strip()
-        response = re.sub(r'^```json\s*', '', response, flags=re.MULTILINE)
-        response = re.sub(r'^```\s*', '', response, flags=re.MULTILINE) 
-        response = re.sub(r'```$', '', response, flags=re.MULTILINE)
+        response = _RE_FENCE_JSON_OPEN.sub('', response)
+        response = _RE_FENCE_OPEN.sub('', response)
+        response = _RE_FENCE_CLOSE.sub('', response)
         
         # Step 2: Extract JSON object
-        json_match = re.search(r'\{.*\}', response, re.DOTALL)
+        json_match = _RE_JSON_OBJECT.search(response)
         if json_match:
             response = json_match.group(0)
         
         # Step 3: Fix array syntax (0, 0, 0) -> [0, 0, 0]
-        response = re.sub(r'\((\s*[-\d\.\s,]+\s*)\)', r'[\1]', response)
+        response = _RE_TUPLE_ARRAY.sub(r'[\1]', response)
         
         # Step 4: Fix missing commas - CONSERVATIVE APPROACH
         # Only fix obvious missing commas between object properties on separate lines
@@ -155,21 +597,21 @@ class LLMAPIMapper:
         
         # Step 5: Fix malformed API names - replace invalid calls with valid ones
         # Fix: bpy.data.materials['RedMaterial'].diffuse_color -> bpy.ops.object.select_all
-        response = re.sub(r'"api_name":\s*"bpy\.data\.materials\[[^\]]+\][^"]*"', '"api_name": "bpy.ops.object.select_all"', response)
+        response = _RE_API_DATA_MATERIALS.sub('"api_name": "bpy.ops.object.select_all"', response)
         
         # Fix other invalid API patterns
-        response = re.sub(r'"api_name":\s*"bpy\.ops\.material\.new"', '"api_name": "bpy.ops.object.select_all"', response)
-        response = re.sub(r'"api_name":\s*"bpy\.ops\.view3d\.[^"]*"', '"api_name": "bpy.ops.transform.translate"', response)
+        response = _RE_API_MATERIAL_NEW.sub('"api_name": "bpy.ops.object.select_all"', response)
+        response = _RE_API_VIEW3D.sub('"api_name": "bpy.ops.transform.translate"', response)
         
         # Step 6: Fix single quotes 'WORLD' -> "WORLD" (but avoid breaking already fixed API names)
-        response = re.sub(r"'([^']*)'", r'"\1"', response)
+        response = _RE_SINGLE_QUOTED.sub(r'"\1"', response)
         
         # Step 7: Remove invalid parameter references
-        response = re.sub(r'"material":\s*bpy\.data\.materials\[[^\]]+\]', '"material": "WhiteMaterial"', response)
+        response = _RE_MATERIAL_REFERENCE.sub('"material": "WhiteMaterial"', response)
         
         # Step 8: Fix malformed API patterns with semantic awareness
         # Don't force spheres - use context-appropriate defaults
-        response = re.sub(r'"api_name":\s*"bpy\.ops\.obj[^"]*"', '"api_name": "bpy.ops.mesh.primitive_cylinder_add"', response)
+        response = _RE_API_OBJ.sub('"api_name": "bpy.ops.mesh.primitive_cylinder_add"', response)
         
         # Step 9: Convert Python literals
         response = response.replace('None', 'null')
@@ -177,17 +619,32 @@ class LLMAPIMapper:
         response = response.replace('False', 'false')
         
         # Step 10: Remove trailing commas
-        response = re.sub(r',(\s*[}\]])', r'\1', response)
-        
-        # Step 11: Handle smart quotes
-        response = response.replace('"', '"').replace('"', '"')
-        response = response.replace(''', "'").replace(''', "'")
+        response = _RE_TRAILING_COMMA.sub(r'\1', response)
         
         return response.strip()
 
+    @staticmethod
+    def _load_clean_json(response: str) -> Optional[Dict[str, Any]]:
+        """
+        Parse a stripped response that _clean_json_response would return unchanged
+        
+        Returns None when cleanup is needed, so callers only parse once on the
+        happy path and fall back to cleaning otherwise.
+        """
+        if not (response.startswith('{') and response.endswith('}')):
+            return None
+        if any(trigger in response for trigger in _CLEAN_JSON_TRIGGERS):
+            return None
+        # In valid JSON the comma fixer only fires on a value placed on the line after its key
+        if _RE_VALUE_ON_NEXT_LINE.search(response) or _RE_TRAILING_COMMA.search(response):
+            return None
+        try:
+            return _json_loads(response)
+        except ValueError:
+            return None
+
     def _aggressive_json_fix(self, json_str: str) -> str:
         """Apply aggressive JSON fixing for severely malformed responses"""
-        import re
         
         # Fix missing quotes around property names (only for obvious cases)
         lines = json_str.split('\n')
@@ -242,15 +699,20 @@ class LLMAPIMapper:
         """Parse LLM response and extract API calls"""
         
         try:
-            # Clean the response first
-            cleaned_response = self._clean_json_response(response)
+            # Well-formed responses (the norm in JSON mode) are parsed once, uncleaned
+            cleaned_response = response.strip()
+            data = self._load_clean_json(cleaned_response)
+            if data is None:
+                # Clean the response first
+                cleaned_response = self._clean_json_response(response)
             
             # Try multiple JSON parsing approaches for robustness
             api_calls = []
             
             # Approach 1: Try parsing as complete JSON object
             try:
-                data = json.loads(cleaned_response)
+                if data is None:
+                    data = _json_loads(cleaned_response)
                 if isinstance(data, dict) and "api_calls" in data:
                     api_calls = data["api_calls"]
                     print(f"✅ Parsed as JSON object with api_calls array: {len(api_calls)} calls")
@@ -266,7 +728,7 @@ class LLMAPIMapper:
                 # Approach 2: Try more aggressive JSON fixing
                 try:
                     fixed_response = self._aggressive_json_fix(cleaned_response)
-                    data = json.loads(fixed_response)
+                    data = _json_loads(fixed_response)
                     if isinstance(data, dict) and "api_calls" in data:
                         api_calls = data["api_calls"]
                         print(f"✅ Aggressive JSON fixing successful: {len(api_calls)} calls")
@@ -278,13 +740,12 @@ class LLMAPIMapper:
                 
                 # Approach 3: Try regex extraction as fallback
                 if not api_calls:
-                    import re
                     json_match = re.search(r'\{.*"api_calls"\s*:\s*\[.*?\]\s*.*?\}', cleaned_response, re.DOTALL)
                     if json_match:
                         try:
                             json_str = json_match.group(0)
                             print(f"🔧 Attempting regex extraction: {json_str[:200]}...")
-                            data = json.loads(json_str)
+                            data = _json_loads(json_str)
                             api_calls = data.get("api_calls", [])
                             print(f"✅ Regex extraction successful: {len(api_calls)} calls")
                         except Exception as regex_error:
@@ -296,7 +757,7 @@ class LLMAPIMapper:
                         if array_match:
                             try:
                                 array_str = array_match.group(0)
-                                api_calls = json.loads(array_str)
+                                api_calls = _json_loads(array_str)
                                 print(f"✅ Array extraction successful: {len(api_calls)} calls")
                             except Exception as array_error:
                                 print(f"❌ Array extraction failed: {array_error}")
@@ -311,19 +772,19 @@ class LLMAPIMapper:
             print(f"📝 Raw LLM Response (first 500 chars): {response[:500]}...")
             print(f"📝 Response length: {len(response)} characters")
             
-            # Save full response to file for debugging
-            debug_file = Path("debug_llm_full_response.json")
-            debug_file.write_text(response, encoding='utf-8')
-            print(f"💾 Full LLM response saved to: {debug_file}")
+            # Save the raw response for debugging, only when debug logging is on
+            if logger.isEnabledFor(logging.DEBUG):
+                debug_file = Path("debug_llm_full_response.json")
+                debug_file.write_text(response[:_DEBUG_DUMP_MAX_CHARS], encoding='utf-8')
+                logger.debug("Full LLM response saved to: %s", debug_file)
             
             # Try to extract JSON using regex as fallback
-            import re
             json_match = re.search(r'\[.*\]', response, re.DOTALL)
             if json_match:
                 try:
                     json_str = json_match.group(0)
                     print(f"🔧 Attempting regex extraction: {json_str[:200]}...")
-                    api_calls = json.loads(json_str)
+                    api_calls = _json_loads(json_str)
                     print(f"✅ Regex extraction successful! Found {len(api_calls)} API calls")
                     return self._validate_api_calls(api_calls)
                 except Exception as regex_e:
@@ -334,41 +795,7 @@ class LLMAPIMapper:
     def _validate_api_calls(self, api_calls: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Validate and clean API calls structure - REPLACE INVALID CALLS WITH VALID ONES"""
         validated_calls = []
-        
-        # Valid Blender API operations (guaranteed to work)
-        valid_apis = {
-            "mesh_creation": [
-                "bpy.ops.mesh.primitive_cube_add",
-                "bpy.ops.mesh.primitive_uv_sphere_add", 
-                "bpy.ops.mesh.primitive_cylinder_add",
-                "bpy.ops.mesh.primitive_cone_add"
-            ],
-            "transformations": [
-                "bpy.ops.transform.translate",
-                "bpy.ops.transform.rotate", 
-                "bpy.ops.transform.resize"
-            ],
-            "object_ops": [
-                "bpy.ops.object.select_all",
-                "bpy.ops.object.duplicate_move"
-            ],
-            "material_ops": [
-                # Core material operations
-                "bpy.ops.material.new",
-                "bpy.ops.material.copy", 
-                "bpy.ops.material.paste",
-                
-                # Object material slot operations
-                "bpy.ops.object.material_slot_add",
-                "bpy.ops.object.material_slot_assign",
-                "bpy.ops.object.material_slot_copy",
-                "bpy.ops.object.material_slot_deselect",
-                "bpy.ops.object.material_slot_move",
-                "bpy.ops.object.material_slot_remove",
-                "bpy.ops.object.material_slot_remove_unused",
-                "bpy.ops.object.material_slot_select"
-            ]
-        }
+        validate_and_clean = self.api_validator.validate_and_clean
         
         for call in api_calls:
             if isinstance(call, dict) and "api_name" in call:
@@ -387,14 +814,14 @@ class LLMAPIMapper:
                     call["parameters"] = {"value": [0, 0, 0]}
                     call["description"] = "Position objects safely"
                     
-                elif not any(valid_api in api_name for valid_group in valid_apis.values() for valid_api in valid_group):
+                elif not any(valid_api in api_name for valid_api in _VALID_API_NAMES):
                     # Unknown/invalid API -> default to sphere creation
                     api_name = "bpy.ops.mesh.primitive_uv_sphere_add"
                     call["parameters"] = {"radius": 1.0, "location": [0, 0, 0]}
                     call["description"] = "Create basic sphere primitive"
                 
                 # Validate API call using the simple validator
-                validation_result = self.api_validator.validate_and_clean(
+                validation_result = validate_and_clean(
                     api_name, 
                     call.get("parameters", {})
                 )
@@ -424,114 +851,86 @@ class LLMAPIMapper:
         Intelligent fallback mapping when LLM fails to generate API calls.
         Uses semantic understanding of object types for appropriate geometry selection.
         """
-        fallback_apis = []
+        task_type = subtask.type.value
         
-        if subtask.type.value == "CREATE_OBJECT":
+        if task_type == "CREATE_OBJECT":
             # Semantic shape selection based on object name/description
             object_name = subtask.title.lower()
             description = subtask.description.lower() if subtask.description else ""
             combined_text = f"{object_name} {description}"
             
-            # Coffee mug/cup detection
-            if any(word in combined_text for word in ['mug', 'cup', 'coffee', 'tea']):
-                fallback_apis = [
-                    {
-                        "api_name": "bpy.ops.mesh.primitive_cylinder_add",
-                        "parameters": {"radius": 0.8, "depth": 1.2, "location": [0, 0, 0]},
-                        "description": f"Create cylinder body for {subtask.title}",
-                        "execution_order": 1
-                    },
-                    {
-                        "api_name": "bpy.ops.mesh.primitive_torus_add",
-                        "parameters": {"major_radius": 0.6, "minor_radius": 0.1, "location": [1.0, 0, 0.3]},
-                        "description": f"Create torus handle for {subtask.title}",
-                        "execution_order": 2
-                    }
-                ]
-            # Chair detection
-            elif any(word in combined_text for word in ['chair', 'seat', 'stool']):
-                fallback_apis = [
-                    {
-                        "api_name": "bpy.ops.mesh.primitive_cube_add",
-                        "parameters": {"size": 1.0, "location": [0, 0, 0.5]},
-                        "description": f"Create seat for {subtask.title}",
-                        "execution_order": 1
-                    },
-                    {
-                        "api_name": "bpy.ops.mesh.primitive_cube_add",
-                        "parameters": {"size": 1.0, "location": [0, -0.4, 1.2]},
-                        "description": f"Create backrest for {subtask.title}",
-                        "execution_order": 2
-                    }
-                ]
-            # Ball/sphere detection
-            elif any(word in combined_text for word in ['ball', 'sphere', 'globe', 'orb']):
-                fallback_apis = [{
-                    "api_name": "bpy.ops.mesh.primitive_uv_sphere_add",
-                    "parameters": {"radius": 1.0, "location": [0, 0, 0]},
-                    "description": f"Create sphere for {subtask.title}",
-                    "execution_order": 1
-                }]
-            # Table detection
-            elif any(word in combined_text for word in ['table', 'desk', 'surface']):
-                fallback_apis = [
-                    {
-                        "api_name": "bpy.ops.mesh.primitive_cube_add",
-                        "parameters": {"size": 2.0, "location": [0, 0, 1.0]},
-                        "description": f"Create table top for {subtask.title}",
-                        "execution_order": 1
-                    }
-                ]
-            # Default fallback - cylinder (more versatile than cube)
-            else:
-                fallback_apis = [{
-                    "api_name": "bpy.ops.mesh.primitive_cylinder_add",
-                    "parameters": {"radius": 1.0, "depth": 2.0, "location": [0, 0, 0]},
-                    "description": f"Create basic cylindrical object for {subtask.title}",
-                    "execution_order": 1
-                }]
-                
-        elif subtask.type.value == "APPLY_MATERIAL":
-            # Basic material creation and application
-            fallback_apis = [
-                {
-                    "api_name": "bpy.data.materials.new",
-                    "parameters": {"name": "BasicMaterial"},
-                    "description": "Create basic material",
-                    "execution_order": 1
-                },
-                {
-                    "api_name": "bpy.context.object.data.materials.append",
-                    "parameters": {"material": "BasicMaterial"},
-                    "description": "Apply material to active object",
-                    "execution_order": 2
-                }
-            ]
-        elif subtask.type.value == "ADD_TEXT":
-            fallback_apis = [{
-                "api_name": "bpy.ops.object.text_add",
-                "parameters": {"location": [0, 0, 0]},
-                "description": f"Add text for {subtask.title}",
-                "execution_order": 1
-            }]
-        
-        return fallback_apis
+            templates = next(
+                (templates for keywords, templates in _FALLBACK_OBJECT_TEMPLATES
+                 if any(word in combined_text for word in keywords)),
+                _FALLBACK_DEFAULT_OBJECT_TEMPLATE
+            )
+        else:
+            templates = _FALLBACK_TYPE_TEMPLATES.get(task_type, ())
+        
+        return _fallback_api_calls(templates, subtask.title)
     
     async def map_multiple_subtasks(self, subtasks: List[SubTask]) -> Dict[str, List[Dict[str, Any]]]:
-        """Map multiple subtasks concurrently"""
+        """Map multiple subtasks concurrently, several per LLM request"""
         
-        tasks = [self.map_subtask_to_apis(subtask) for subtask in subtasks]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+        mapping_results = {
+            task_id: api_calls
+            async for task_id, api_calls in self.iter_subtask_mappings(subtasks)
+        }
         
-        mapping_results = {}
-        for subtask, result in zip(subtasks, results):
-            if isinstance(result, Exception):
-                print(f"Failed to map subtask {subtask.task_id}: {result}")
-                mapping_results[subtask.task_id] = []
-            else:
-                mapping_results[subtask.task_id] = result
+        # Keep the caller's subtask order
+        return {subtask.task_id: mapping_results[subtask.task_id] for subtask in subtasks}
+    
+    async def iter_subtask_mappings(
+        self, subtasks: List[SubTask]
+    ) -> AsyncIterator[Tuple[str, List[Dict[str, Any]]]]:
+        """
+        Map multiple subtasks concurrently, yielding (task_id, api_calls) as each completes
         
-        return mapping_results
+        Subtasks are sent GEMINI_BATCH (default 6) per LLM request; any a batch
+        doesn't cover are retried with one request each.
+        """
+        
+        async def map_batch(batch: List[SubTask]) -> Tuple[List[SubTask], Dict[str, List[Dict[str, Any]]]]:
+            try:
+                return batch, await self.map_subtasks_to_apis(batch)
+            except Exception as e:
+                print(f"Failed to map batch of {len(batch)} subtasks: {e}")
+                return batch, {}
+        
+        async def map_single(subtask: SubTask) -> Tuple[SubTask, List[Dict[str, Any]]]:
+            try:
+                return subtask, await self.map_subtask_to_apis(subtask)
+            except Exception as e:
+                print(f"Failed to map subtask {subtask.task_id}: {e}")
+                return subtask, []
+        
+        # Amortize the prompt context over GEMINI_BATCH subtasks per request
+        batch_size = max(1, int(os.getenv("GEMINI_BATCH", "6")))
+        batch_tasks = {
+            asyncio.create_task(map_batch(subtasks[i:i + batch_size]))
+            for i in range(0, len(subtasks), batch_size)
+        }
+        pending = set(batch_tasks)
+        
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task in batch_tasks:
+                        batch, batched = task.result()
+                        for subtask in batch:
+                            if subtask.task_id in batched:
+                                yield subtask.task_id, batched[subtask.task_id]
+                            else:
+                                # Not covered by the batch, so fall back to one request
+                                pending.add(asyncio.create_task(map_single(subtask)))
+                    else:
+                        subtask, api_calls = task.result()
+                        yield subtask.task_id, api_calls
+        finally:
+            # The consumer stopped early; don't leave requests running
+            for task in pending:
+                task.cancel()
 
 # Example usage and testing
 async def test_llm_mapper():
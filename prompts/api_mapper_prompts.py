@@ -3,7 +3,7 @@ API Mapper Prompts - Structured LLM Prompt Templates for Blender API Mapping
 Following EAG-V17 approach with clear OUTPUT_FORMAT specifications
 """
 
-from typing import Dict, Any
+from typing import Dict, Any, List
 from agents.models import SubTask
 
 
@@ -367,6 +367,35 @@ You MUST respond with EXACTLY this JSON structure. Any deviation will cause syst
 
 Remember: You are mapping ONE granular subtask to a sequence of Blender API calls. Be precise, be complete, and follow the exact JSON format specified above."""
 
+    @staticmethod
+    def get_batch_prompt_template() -> str:
+        """
+        Get the base prompt template for mapping several subtasks per request
+        
+        Returns:
+            The base template with its single-subtask output format replaced
+            by the batched {"mappings": [...]} structure
+        """
+        base_template = APIMapperPrompts.get_base_prompt_template()
+        single_reminder = base_template[base_template.rindex("Remember: You are mapping ONE granular subtask"):]
+        return base_template[:-len(single_reminder)] + """## 📦 BATCH MODE - OUTPUT FORMAT OVERRIDE
+
+Each request lists SEVERAL granular subtasks, each under a heading with its task_id. Map EACH of them independently, exactly as described above for a single subtask.
+
+The {"api_calls": [...]} structure above is the format of ONE subtask's mapping. In batch mode you MUST NOT respond with it directly; wrap one such mapping per task_id instead:
+{
+  "mappings": [
+    {
+      "task_id": "<task_id from the request>",
+      "api_calls": [ ...api call objects exactly as specified above... ]
+    }
+  ]
+}
+
+Include one entry for EVERY task_id in the request, using the task_id verbatim.
+
+Remember: You are mapping SEVERAL granular subtasks, each to its own sequence of Blender API calls. Be precise, be complete, and follow the batched JSON format specified in this section."""
+    
     @staticmethod
     def create_subtask_mapping_prompt(subtask: SubTask) -> str:
         """
@@ -378,10 +407,21 @@ Remember: You are mapping ONE granular subtask to a sequence of Blender API call
         Returns:
             Complete prompt string with base template + subtask context
         """
-        base_prompt = APIMapperPrompts.get_base_prompt_template()
+        return APIMapperPrompts.get_base_prompt_template() + APIMapperPrompts.create_subtask_body(subtask)
+    
+    @staticmethod
+    def create_subtask_body(subtask: SubTask) -> str:
+        """
+        Create the subtask-specific part of the mapping prompt
         
-        # Add the specific subtask context
-        subtask_context = f"""
+        Args:
+            subtask: The granular subtask to map
+            
+        Returns:
+            Subtask context to send after the base template (e.g. as the
+            user turn when the template is the system instruction)
+        """
+        return f"""
 
 ---
 
@@ -413,8 +453,67 @@ Map the above subtask to a sequence of Blender API calls. Consider the task type
 
 Remember: Output ONLY the JSON structure specified in the OUTPUT FORMAT section above. No markdown, no additional text, just the JSON.
 """
+    
+    @staticmethod
+    def create_batch_body(subtasks: List[SubTask]) -> str:
+        """
+        Create the subtask-specific part of the batched mapping prompt
+        
+        Args:
+            subtasks: The granular subtasks to map
+            
+        Returns:
+            One section per subtask plus the batched output format, to send
+            after the batch template
+        """
+        sections = []
+        for number, subtask in enumerate(subtasks, 1):
+            sections.append(f"""
+### {number}. task_id: {subtask.task_id}
+
+**Title:** {subtask.title}
+
+**Description:** {subtask.description}
+
+**Task Type:** {subtask.type.value}
+
+**Complexity:** {subtask.complexity.value}
+
+**Requirements:** {', '.join(subtask.requirements) if hasattr(subtask, 'requirements') and subtask.requirements else 'None specified'}
+
+**Mesh Operations:** {getattr(subtask, 'mesh_operations', [])}
+
+**Object Count:** {getattr(subtask, 'object_count', 1)}
+
+**Context:** {getattr(subtask, 'context', {})}
+
+**Blender Categories:** {getattr(subtask, 'blender_categories', [])}
+""")
         
-        return base_prompt + subtask_context
+        return f"""
+
+---
+
+## 📋 CURRENT SUBTASKS TO MAP
+{''.join(sections)}
+---
+
+## 🎯 YOUR TASK
+
+Map EACH of the above subtasks independently to a sequence of Blender API calls, exactly as you would for a single subtask.
+
+Output ONLY this JSON structure, with one entry per task_id listed above:
+{{
+  "mappings": [
+    {{
+      "task_id": "<task_id>",
+      "api_calls": [ ...same api_calls format as the OUTPUT FORMAT section above... ]
+    }}
+  ]
+}}
+
+No markdown, no additional text, just the JSON.
+"""
     
     @staticmethod
     def get_fallback_prompt() -> str:
@@ -0,0 +1,107 @@
+"""
+Tests for parsing batched LLM API mapper responses
+Runs offline: no Gemini request is made
+"""
+
+import json
+
+from agents.llm_api_mapper import LLMAPIMapper
+from agents.simple_validator import SimpleAPIValidator
+from agents.models import SubTask, TaskType
+
+CUBE_CALL = {
+    "api_name": "bpy.ops.mesh.primitive_cube_add",
+    "parameters": {"size": 2.0, "location": [0, 0, 0]},
+    "description": "Add a cube",
+    "execution_order": 1
+}
+
+SPHERE_CALL = {
+    "api_name": "bpy.ops.mesh.primitive_uv_sphere_add",
+    "parameters": {"radius": 1.0, "location": [0, 0, 2]},
+    "description": "Add a sphere",
+    "execution_order": 1
+}
+
+def create_mapper() -> LLMAPIMapper:
+    """Create a mapper for parsing only, skipping the Gemini client setup"""
+    mapper = LLMAPIMapper.__new__(LLMAPIMapper)
+    mapper.api_validator = SimpleAPIValidator()
+    return mapper
+
+def create_subtask(task_id: str, title: str) -> SubTask:
+    """Create a minimal object creation subtask"""
+    return SubTask(
+        task_id=task_id,
+        type=TaskType.CREATE_OBJECT,
+        title=title,
+        description=f"{title} in the scene"
+    )
+
+def api_names(api_calls):
+    """Get the API names of a list of API calls"""
+    return [call["api_name"] for call in api_calls]
+
+def test_batch_list_form():
+    """Test the {"mappings": [{"task_id": ..., "api_calls": [...]}]} form"""
+    print("🧪 Testing batched list form...")
+
+    mapper = create_mapper()
+    subtasks = [create_subtask("task_1", "Add a cube"), create_subtask("task_2", "Add a sphere")]
+    response = json.dumps({
+        "mappings": [
+            {"task_id": "task_1", "api_calls": [CUBE_CALL]},
+            {"task_id": "task_2", "api_calls": [SPHERE_CALL]},
+            {"task_id": "task_3", "api_calls": [CUBE_CALL]}
+        ]
+    })
+
+    results = mapper._parse_batch_llm_response(response, subtasks)
+
+    # Unrequested task_ids are dropped
+    assert sorted(results) == ["task_1", "task_2"]
+    assert api_names(results["task_1"]) == ["bpy.ops.mesh.primitive_cube_add"]
+    assert api_names(results["task_2"]) == ["bpy.ops.mesh.primitive_uv_sphere_add"]
+    print("   ✅ List form mapped by task_id")
+
+def test_batch_dict_form():
+    """Test the {"<task_id>": [...]} and {"<task_id>": {"api_calls": [...]}} forms"""
+    print("🧪 Testing batched dict form...")
+
+    mapper = create_mapper()
+    subtasks = [create_subtask("task_1", "Add a cube"), create_subtask("task_2", "Add a sphere")]
+    response = json.dumps({
+        "task_1": [CUBE_CALL],
+        "task_2": {"api_calls": [SPHERE_CALL]}
+    })
+
+    results = mapper._parse_batch_llm_response(response, subtasks)
+
+    assert sorted(results) == ["task_1", "task_2"]
+    assert api_names(results["task_1"]) == ["bpy.ops.mesh.primitive_cube_add"]
+    assert api_names(results["task_2"]) == ["bpy.ops.mesh.primitive_uv_sphere_add"]
+    print("   ✅ Dict form mapped by task_id")
+
+def test_batch_single_subtask_schema():
+    """Test a single-subtask {"api_calls": [...]} reply to a batched request"""
+    print("🧪 Testing single-subtask schema in a batch...")
+
+    mapper = create_mapper()
+    response = json.dumps({"api_calls": [CUBE_CALL]})
+
+    # Attributed to the only subtask of a one-subtask batch
+    results = mapper._parse_batch_llm_response(response, [create_subtask("task_1", "Add a cube")])
+    assert list(results) == ["task_1"]
+    assert api_names(results["task_1"]) == ["bpy.ops.mesh.primitive_cube_add"]
+
+    # Ambiguous with several subtasks, so nothing is mapped
+    subtasks = [create_subtask("task_1", "Add a cube"), create_subtask("task_2", "Add a sphere")]
+    results = mapper._parse_batch_llm_response(response, subtasks)
+    assert results == {}
+    print("   ✅ Single-subtask schema only used for one-subtask batches")
+
+if __name__ == "__main__":
+    test_batch_list_form()
+    test_batch_dict_form()
+    test_batch_single_subtask_schema()
+    print("\n🎉 LLM API mapper tests passed!")